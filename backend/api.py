@@ -1,17 +1,22 @@
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Flask, Response, jsonify, send_from_directory, request, stream_with_context
 from flask_cors import CORS
 import pandas as pd
+import hmac
 import json
 import os
 from collections import defaultdict
-import glob
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema import HumanMessage
+from embedding_backend import load_embedder
+from keyword_index import load_keyword_index, normalize_rows
+from caching import LLMAnalysisCache, PrecomputedResponse, TTLCache
+from snapshot import DataSnapshot, SnapshotManager
+from columnar import list_tables, load_manifest
+from row_index import CategoryRowIndex, MAX_PAGE_SIZE, PAGE_SIZE
 
 # Load environment variables
 load_dotenv()
@@ -19,97 +24,175 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize sentence transformer for embeddings
-print("Loading SentenceTransformer model...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Initialize embedding model (EMBEDDING_BACKEND=onnx for ONNX Runtime, see embedding_backend.py)
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'sentence-transformers')
+EMBEDDING_QUANTIZE = os.getenv('EMBEDDING_QUANTIZE', '0') == '1'
+print(f"Loading {EMBEDDING_BACKEND} embedding model...")
+model = load_embedder(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, quantize=EMBEDDING_QUANTIZE)
 print("Model loaded successfully!")
 
-# Initialize Gemini LLM
-print("Initializing Google Gemini...")
-try:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash-lite",
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
-        temperature=0.7
-    )
-    print("Gemini initialized successfully!")
-except Exception as e:
-    print(f"Failed to initialize Gemini: {e}")
-    llm = None
+# Backends produce slightly different vectors, so persisted embeddings are keyed on all three
+EMBEDDING_CACHE_KEY = f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}{':int8' if EMBEDDING_QUANTIZE and EMBEDDING_BACKEND == 'onnx' else ''}"
+
+# Cache embeddings of user-typed text so popular queries skip the transformer
+query_embedding_cache = TTLCache(max_size=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '10000')))
+
+def normalize_query_text(text):
+    """Cache key for ad-hoc text: lowercase with collapsed whitespace"""
+    return ' '.join(text.lower().split())
+
+def encode_queries(texts):
+    """Encode ad-hoc text into normalized embeddings, reusing cached vectors"""
+    # all-MiniLM-L6-v2 is uncased, so encoding the normalized key gives the same vector
+    keys = [normalize_query_text(text) for text in texts]
+    embeddings = [query_embedding_cache.get(key) for key in keys]
+    
+    missing = list(dict.fromkeys(key for key, embedding in zip(keys, embeddings) if embedding is None))
+    if missing:
+        encoded = {}
+        for key, embedding in zip(missing, normalize_rows(model.encode(missing, batch_size=64))):
+            embedding.setflags(write=False)
+            query_embedding_cache.set(key, embedding)
+            encoded[key] = embedding
+        embeddings = [encoded[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+    
+    return np.vstack(embeddings)
+
+# Gemini LLM, created per process by init_worker()
+llm = None
+
+def init_llm():
+    """Initialize Gemini LLM"""
+    global llm
+    print("Initializing Google Gemini...")
+    try:
+        llm = ChatGoogleGenerativeAI(
+            model="gemini-2.5-flash-lite",
+            google_api_key=os.getenv("GOOGLE_API_KEY"),
+            temperature=0.7
+        )
+        print("Gemini initialized successfully!")
+    except Exception as e:
+        print(f"Failed to initialize Gemini: {e}")
+        llm = None
+
+# Cache parsed Gemini analyses so repeat lookups skip the LLM round trip.
+# Set LLM_CACHE_PATH to share the cache between gunicorn workers.
+llm_cache = LLMAnalysisCache(
+    max_size=int(os.getenv('LLM_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('LLM_CACHE_TTL', '86400')),
+    path=os.getenv('LLM_CACHE_PATH') or None,
+    disk_max_entries=int(os.getenv('LLM_CACHE_DISK_MAX_ENTRIES', '10000'))
+)
 
 # Load categories and create embeddings
-def load_categories():
+def load_categories(raise_errors=False):
     """Load categories and create embeddings"""
     try:
         df = pd.read_csv('outputs/category.csv')
         categories = df['category'].tolist()
         
-        # Create embeddings for categories
-        category_embeddings = model.encode(categories)
+        # Create normalized embeddings for categories
+        category_embeddings = normalize_rows(model.encode(categories))
         
         return categories, category_embeddings
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error loading categories: {e}")
         return [], []
 
-# Load categories and embeddings on startup
-categories_list, category_embeddings = load_categories()
+# Number of nearest keywords returned alongside the best match
+KEYWORD_MATCH_TOP_K = int(os.getenv('KEYWORD_MATCH_TOP_K', '5'))
+
+# Limits for the batch keyword checker
+KEYWORD_BATCH_MAX = int(os.getenv('KEYWORD_BATCH_MAX', '1000'))
+LLM_BATCH_CONCURRENCY = int(os.getenv('LLM_BATCH_CONCURRENCY', '4'))
+
+def get_category_similarity(snapshot, user_embedding, category):
+    """Cosine similarity between a normalized query embedding and a category name"""
+    if category not in snapshot.categories_list:
+        return 0.0
+    return float(snapshot.category_embeddings[snapshot.categories_list.index(category)] @ user_embedding)
 
 # Load data on startup
-def load_category_data():
+def load_category_data(raise_errors=False):
     """Load category trends data"""
     try:
         df = pd.read_csv('outputs/category_trends.csv')
         return df.to_dict('records')
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error loading category data: {e}")
         return []
 
-def load_keyword_trends():
+def load_keyword_trends(raise_errors=False):
     """Load keyword trend insights"""
     try:
         with open('outputs/keyword_trend_insights.json', 'r') as f:
             return json.load(f)
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error loading keyword trends: {e}")
         return []
 
 def load_csv_data():
-    """Load data from all CSV files in second_layer_data"""
+    """Index every CSV file in second_layer_data; returns per-file summaries and row indexes"""
     data = {}
-    csv_files = glob.glob('second_layer_data/*.csv')
+    indexes = {}
+    # Reads the typed Parquet copies when they are current (python columnar.py convert)
+    manifest = load_manifest('second_layer_data')
     
-    for file_path in csv_files:
+    for name in list_tables('second_layer_data'):
+        file_path = os.path.join('second_layer_data', f"{name}.csv")
         try:
-            filename = os.path.basename(file_path).replace('.csv', '').replace('_', ' ')
-            
-            # Read a sample of the data (first 1000 rows for performance)
-            df = pd.read_csv(file_path, nrows=1000)
+            filename = name.replace('_', ' ')
             
-            # Convert to records
-            data[filename] = {
-                'total_rows': len(df),
-                'columns': list(df.columns),
-                'sample_data': df.head(10).to_dict('records')
-            }
+            # Only the filter and sort columns are kept in memory, over all rows
+            indexes[filename] = CategoryRowIndex('second_layer_data', name, manifest)
+            data[filename] = indexes[filename].summary()
         except Exception as e:
             print(f"Error loading {file_path}: {e}")
             data[filename] = {'error': str(e)}
     
-    return data
-
-# Load data on startup
-category_data = load_category_data()
-keyword_trends = load_keyword_trends()
-csv_data = load_csv_data()
+    return data, indexes
+
+# Map category name to icon
+CATEGORY_BREAKDOWN_ICONS = {
+    'Makeup & Cosmetics': '💄',
+    'Skincare & Anti-Aging': '🧴',
+    'Hair Coloring & Transformation': '💇‍♀️',
+    'Beauty Reviews & Brands': '⭐',
+    'Facial Care & Exercises': '✨',
+    'Hair Transformations & Makeovers': '💇',
+    'Men\'s Fashion & Style': '👔',
+    'General Beauty & Buzzwords': '🎯',
+    'Hair Styling & Men\'s Grooming': '✂️',
+    'Vlogs & Lifestyle': '📹'
+}
+
+TREND_ANALYSIS_ICONS = {
+    'Beauty Reviews & Brands': '⭐',
+    'General Beauty & Buzzwords': '🎯',
+    'Facial Care & Exercises': '✨',
+    'Hair Coloring & Transformation': '🎨',
+    'Hair Styling & Men\'s Grooming': '✂️',
+    'Hair Transformations & Makeovers': '💇',
+    'Makeup & Cosmetics': '💄',
+    'Men\'s Fashion & Style': '👔',
+    'Skincare & Anti-Aging': '🧴',
+    'Vlogs & Lifestyle': '📹'
+}
 
 @app.route('/api/categories')
 def get_categories():
     """Get category performance data"""
-    return jsonify(category_data)
+    return jsonify(data_snapshots.current.category_data)
 
-@app.route('/api/trending-keywords')
-def get_trending_keywords():
+def build_trending_keywords(keyword_trends):
     """Get trending keywords data"""
     # Extract top trending keywords across all categories
     all_keywords = []
@@ -119,16 +202,15 @@ def get_trending_keywords():
         keywords = category_info.get('keywords', [])
         
         for keyword_info in keywords:
-            keyword_info['category'] = category
-            all_keywords.append(keyword_info)
+            # Copy so the category tag does not leak into keyword_trends
+            all_keywords.append(dict(keyword_info, category=category))
     
     # Sort by growth rate and return top 20
     sorted_keywords = sorted(all_keywords, key=lambda x: x.get('growth_rate', 0), reverse=True)[:20]
     
-    return jsonify(sorted_keywords)
+    return sorted_keywords
 
-@app.route('/api/metrics')
-def get_metrics():
+def build_metrics(keyword_trends):
     """Get overview metrics"""
     total_keywords = sum(len(cat.get('keywords', [])) for cat in keyword_trends)
     trending_up = sum(1 for cat in keyword_trends for kw in cat.get('keywords', []) if kw.get('trend') == 'up')
@@ -151,10 +233,9 @@ def get_metrics():
         'top_keyword': top_keyword
     }
     
-    return jsonify(metrics)
+    return metrics
 
-@app.route('/api/category-breakdown')
-def get_category_breakdown():
+def build_category_breakdown(category_data, keyword_trends):
     """Get detailed category breakdown"""
     breakdown = []
     
@@ -173,27 +254,13 @@ def get_category_breakdown():
         if category_keywords:
             growth_rate = sum(kw.get('growth_rate', 0) for kw in category_keywords) / len(category_keywords)
         
-        # Map category name to icon
-        category_icons = {
-            'Makeup & Cosmetics': '💄',
-            'Skincare & Anti-Aging': '🧴',
-            'Hair Coloring & Transformation': '💇‍♀️',
-            'Beauty Reviews & Brands': '⭐',
-            'Facial Care & Exercises': '✨',
-            'Hair Transformations & Makeovers': '💇',
-            'Men\'s Fashion & Style': '👔',
-            'General Beauty & Buzzwords': '🎯',
-            'Hair Styling & Men\'s Grooming': '✂️',
-            'Vlogs & Lifestyle': '📹'
-        }
-        
         breakdown.append({
             'name': category_name,
             'count': len(category_keywords),
             'percentage': min(100, max(0, int(category_data_item.get('engagement_rate', 0) * 1000))),  # Scale engagement rate
             'growth': f"+{growth_rate:.1f}%" if growth_rate > 0 else f"{growth_rate:.1f}%",
             'trend': 'up' if growth_rate > 0 else 'down',
-            'icon': category_icons.get(category_name, '📊'),
+            'icon': CATEGORY_BREAKDOWN_ICONS.get(category_name, '📊'),
             'viewCount': int(category_data_item.get('viewCount', 0)),
             'likeCount': int(category_data_item.get('likeCount', 0)),
             'commentCount': int(category_data_item.get('commentCount', 0)),
@@ -203,48 +270,78 @@ def get_category_breakdown():
     # Sort by percentage (engagement rate scaled)
     breakdown.sort(key=lambda x: x['percentage'], reverse=True)
     
-    return jsonify(breakdown)
+    return breakdown
 
 @app.route('/api/csv-data')
 def get_csv_data():
     """Get information about all CSV files"""
-    return jsonify(csv_data)
+    return jsonify(data_snapshots.current.csv_data)
+
+def get_optional_float(name):
+    """A float query parameter, or None when it is absent"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
 
 @app.route('/api/csv-data/<category>')
 def get_csv_category_data(category):
-    """Get data for a specific category CSV file"""
+    """Page through a category CSV file, optionally filtered and sorted"""
     # Convert URL category back to filename format
-    filename = category.replace('-', ' ').title()
-    
-    if filename in csv_data:
-        return jsonify(csv_data[filename])
-    else:
+    filename = category.replace('-', ' ').replace('_', ' ').lower()
+    snapshot = data_snapshots.current
+    index = next(
+        (index for name, index in snapshot.csv_indexes.items() if name.replace('-', ' ').lower() == filename),
+        None
+    )
+    if index is None:
         return jsonify({'error': 'Category not found'}), 404
+    
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        order = request.args.get('order', 'desc')
+        if order not in ('asc', 'desc'):
+            raise ValueError("order must be asc or desc")
+        
+        keywords = [keyword.strip().lower() for keyword in request.args.get('keywords', '').split(',')]
+        mask = index.match(
+            keywords=[keyword for keyword in keywords if keyword],
+            min_confidence=get_optional_float('min_confidence'),
+            min_engagement=get_optional_float('min_engagement_rate'),
+            max_engagement=get_optional_float('max_engagement_rate')
+        )
+        rows, next_cursor = index.page(
+            mask,
+            sort=request.args.get('sort') or None,
+            descending=order == 'desc',
+            cursor=request.args.get('cursor') or None,
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'total_rows': len(index),
+        'matched_rows': int(mask.sum()),
+        'columns': index.columns,
+        'data': index.fetch(rows),
+        'next_cursor': next_cursor
+    })
 
 @app.route('/api/keyword-trends-by-category')
 def get_keyword_trends_by_category():
     """Get keyword trends organized by category"""
-    return jsonify(keyword_trends)
+    return jsonify(data_snapshots.current.keyword_trends)
 
-@app.route('/api/trend-analysis')
-def get_trend_analysis():
+def build_trend_analysis(keyword_trends):
     """Get comprehensive trend analysis data for the trending page"""
     analysis_data = []
     
-    # Category icons mapping
-    category_icons = {
-        'Beauty Reviews & Brands': '⭐',
-        'General Beauty & Buzzwords': '🎯',
-        'Facial Care & Exercises': '✨',
-        'Hair Coloring & Transformation': '🎨',
-        'Hair Styling & Men\'s Grooming': '✂️',
-        'Hair Transformations & Makeovers': '💇',
-        'Makeup & Cosmetics': '💄',
-        'Men\'s Fashion & Style': '👔',
-        'Skincare & Anti-Aging': '🧴',
-        'Vlogs & Lifestyle': '📹'
-    }
-    
     # Calculate trend analysis for each category
     for i, category_data in enumerate(keyword_trends):
         category_name = category_data.get('category', '')
@@ -295,7 +392,7 @@ def get_trend_analysis():
             'category': category_name,
             'trend': category_trend,
             'change': change_str,
-            'icon': category_icons.get(category_name, '📊'),
+            'icon': TREND_ANALYSIS_ICONS.get(category_name, '📊'),
             'rank': rank,
             'keywords': top_keywords,
             'avg_growth': avg_growth,
@@ -308,10 +405,9 @@ def get_trend_analysis():
     for i, item in enumerate(analysis_data):
         item['rank'] = i + 1
     
-    return jsonify(analysis_data)
+    return analysis_data
 
-@app.route('/api/trend-summary')
-def get_trend_summary():
+def build_trend_summary(keyword_trends):
     """Get summary statistics for trending analysis"""
     total_categories = len(keyword_trends)
     categories_trending_up = 0
@@ -337,20 +433,137 @@ def get_trend_summary():
         hot_keywords_count += sum(1 for kw in keywords if kw.get('growth_rate', 0) > 10)
     
     # Calculate overall statistics
-    highest_growth = max(kw.get('growth_rate', 0) for cat in keyword_trends for kw in cat.get('keywords', []))
+    highest_growth = max((kw.get('growth_rate', 0) for cat in keyword_trends for kw in cat.get('keywords', [])), default=0)
     avg_category_growth = sum(all_growth_rates) / len(all_growth_rates) if all_growth_rates else 0
     percentage_trending_up = (categories_trending_up / total_categories * 100) if total_categories > 0 else 0
     
-    return jsonify({
+    return {
         'categories_trending_up_percentage': f"{percentage_trending_up:.0f}%",
         'highest_growth': f"+{highest_growth:.1f}%",
         'hot_keywords_count': hot_keywords_count,
         'avg_category_growth': f"+{avg_category_growth:.1f}%"
-    })
+    }
+
+def build_precomputed_responses(category_data, keyword_trends):
+    """Serialize and gzip every read-only dashboard payload once per data load"""
+    payloads = {
+        'trending-keywords': build_trending_keywords(keyword_trends),
+        'metrics': build_metrics(keyword_trends),
+        'category-breakdown': build_category_breakdown(category_data, keyword_trends),
+        'trend-analysis': build_trend_analysis(keyword_trends),
+        'trend-summary': build_trend_summary(keyword_trends)
+    }
+    return {name: PrecomputedResponse(payload) for name, payload in payloads.items()}
+
+def build_data_snapshot(version, initial=False):
+    """Load every data file the API serves, plus its embeddings and precomputed payloads"""
+    # A failed reload keeps the previous snapshot, so only the first load tolerates errors
+    raise_errors = not initial
+    categories_list, category_embeddings = load_categories(raise_errors)
+    category_data = load_category_data(raise_errors)
+    keyword_trends = load_keyword_trends(raise_errors)
+    csv_data, csv_indexes = load_csv_data()
+    
+    return DataSnapshot(
+        version,
+        categories_list=categories_list,
+        category_embeddings=category_embeddings,
+        # Embed every third-layer keyword once so requests only encode the user keyword
+        keyword_index=load_keyword_index(model.encode, EMBEDDING_CACHE_KEY),
+        category_data=category_data,
+        keyword_trends=keyword_trends,
+        csv_data=csv_data,
+        csv_indexes=csv_indexes,
+        precomputed_responses=build_precomputed_responses(category_data, keyword_trends)
+    )
+
+# Load data on startup and reload it in the background when the pipeline publishes new files
+data_snapshots = SnapshotManager(
+    build_data_snapshot,
+    paths=['outputs', 'second_layer_data', 'third_layer_data'],
+    interval=float(os.getenv('DATA_RELOAD_INTERVAL', '30')),
+    # Touched by POST /api/reload so every gunicorn worker reloads, not just the one serving it
+    reload_marker=os.path.join('outputs', '.reload-requested')
+)
+
+@app.before_request
+def follow_reload_requests():
+    data_snapshots.check_reload_marker()
+
+@app.after_request
+def add_data_version_header(response):
+    response.headers['X-Data-Version'] = data_snapshots.current.version
+    return response
+
+@app.route('/api/data-version')
+def get_data_version():
+    """Get the version of the data currently being served"""
+    snapshot = data_snapshots.current
+    return jsonify({'version': snapshot.version, 'loaded_at': snapshot.loaded_at})
+
+@app.route('/api/reload', methods=['POST'])
+def reload_data():
+    """Reload the data files in every worker without restarting the server"""
+    reload_token = os.getenv('RELOAD_TOKEN')
+    if not reload_token:
+        return jsonify({'error': 'Reload is disabled: RELOAD_TOKEN is not set'}), 403
+    if not hmac.compare_digest(request.headers.get('X-Reload-Token', ''), reload_token):
+        return jsonify({'error': 'Invalid reload token'}), 403
+    
+    try:
+        data_snapshots.request_reload()
+    except Exception as e:
+        print(f"Error reloading data: {e}")
+        return jsonify({'error': f'Reload failed, still serving previous data: {str(e)}'}), 500
+    
+    snapshot = data_snapshots.current
+    return jsonify({'version': snapshot.version, 'loaded_at': snapshot.loaded_at})
+
+def serve_precomputed(name):
+    """Serve a precomputed payload, gzipped when accepted and 304 when the ETag matches"""
+    precomputed = data_snapshots.current.precomputed_responses[name]
+    
+    if request.accept_encodings['gzip']:
+        response = Response(precomputed.gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(f"{precomputed.etag}-gzip")
+    else:
+        response = Response(precomputed.body, mimetype='application/json')
+        response.set_etag(precomputed.etag)
+    response.vary.add('Accept-Encoding')
+    
+    return response.make_conditional(request)
+
+@app.route('/api/trending-keywords')
+def get_trending_keywords():
+    """Get trending keywords data"""
+    return serve_precomputed('trending-keywords')
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Get overview metrics"""
+    return serve_precomputed('metrics')
+
+@app.route('/api/category-breakdown')
+def get_category_breakdown():
+    """Get detailed category breakdown"""
+    return serve_precomputed('category-breakdown')
+
+@app.route('/api/trend-analysis')
+def get_trend_analysis():
+    """Get comprehensive trend analysis data for the trending page"""
+    return serve_precomputed('trend-analysis')
+
+@app.route('/api/trend-summary')
+def get_trend_summary():
+    """Get summary statistics for trending analysis"""
+    return serve_precomputed('trend-summary')
 
 @app.route('/api/growth-chart')
 def get_growth_chart():
     """Get data for growth chart"""
+    keyword_trends = data_snapshots.current.keyword_trends
+    
     # Generate monthly growth data based on keyword trends
     months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
     
@@ -371,90 +584,94 @@ def get_growth_chart():
     
     return jsonify(chart_data)
 
+def get_request_keyword():
+    """Validate the JSON body of a keyword checker request"""
+    data = request.get_json()
+    if not data or 'keyword' not in data:
+        return None, (jsonify({'error': 'Keyword is required'}), 400)
+        
+    user_keyword = data['keyword'].strip()
+    if not user_keyword:
+        return None, (jsonify({'error': 'Keyword cannot be empty'}), 400)
+    
+    return user_keyword, None
+
+def find_keyword_match(snapshot, user_keyword):
+    """Match a keyword against the keyword index and return its category and trend data"""
+    # Search the keywords of every category in a single pass
+    user_embedding = encode_queries([user_keyword])
+    matches = snapshot.keyword_index.search(user_embedding, k=KEYWORD_MATCH_TOP_K)[0]
+    return build_keyword_match(snapshot, user_keyword, user_embedding[0], matches)
+
+def build_keyword_match(snapshot, user_keyword, user_embedding, matches):
+    """Turn the top-k index hits for one keyword into the keyword checker match payload"""
+    if not matches:
+        return None
+    
+    # The best keyword decides the category
+    best_match = matches[0]
+    best_category = best_match['category']
+    keyword_similarity = best_match['score']
+    category_similarity = get_category_similarity(snapshot, user_embedding, best_category)
+    keyword_data = snapshot.keyword_index.record(best_match['row'])
+    best_keyword_match = keyword_data['keyword']
+    
+    print(f"Best matching keyword for '{user_keyword}': {best_keyword_match} in {best_category} (similarity: {keyword_similarity:.3f})")
+    
+    return {
+        'user_keyword': user_keyword,
+        'matched_category': best_category,
+        'category_similarity': round(category_similarity, 3),
+        'matched_keyword': best_keyword_match,
+        'keyword_similarity': round(keyword_similarity, 3),
+        'phase': keyword_data['phase'],
+        'velocity': float(keyword_data['velocity']),
+        'engagement_rate': float(keyword_data['engagement_rate']),
+        'velocity_description': f"{keyword_data['velocity']:.1f} mentions per month (past 3 months)",
+        'engagement_description': f"Popularity score: {keyword_data['engagement_rate']:.3f}",
+        'phase_description': get_phase_description(keyword_data['phase']),
+        'top_matches': [
+            {
+                'keyword': match['keyword'],
+                'category': match['category'],
+                'score': round(match['score'], 3)
+            }
+            for match in matches
+        ]
+    }
+
+def get_keyword_analysis(match):
+    """Get the LLM analysis fields for a keyword match"""
+    print(f"Getting LLM analysis for keyword: {match['user_keyword']}")
+    llm_analysis = analyze_keyword_with_llm(
+        keyword=match['user_keyword'],
+        category=match['matched_category'],
+        phase=match['phase'],
+        velocity=match['velocity'],
+        engagement_rate=match['engagement_rate'],
+        matched_keyword=match['matched_keyword']
+    )
+    return {
+        'future_trend': llm_analysis['future_trend'],
+        'insights': llm_analysis['insights'],
+        'recommendations': llm_analysis['recommendations']
+    }
+
 @app.route('/api/keyword-checker', methods=['POST'])
 def keyword_checker():
     """Check keyword and find matching category and trend data"""
     try:
-        data = request.get_json()
-        if not data or 'keyword' not in data:
-            return jsonify({'error': 'Keyword is required'}), 400
-            
-        user_keyword = data['keyword'].strip()
-        if not user_keyword:
-            return jsonify({'error': 'Keyword cannot be empty'}), 400
-        
-        # Step 1: Find the nearest category using embeddings
-        user_embedding = model.encode([user_keyword])
-        
-        # Calculate cosine similarity with all categories
-        similarities = cosine_similarity(user_embedding, category_embeddings)[0]
-        best_category_idx = np.argmax(similarities)
-        best_category = categories_list[best_category_idx]
-        category_similarity = float(similarities[best_category_idx])
-        
-        print(f"Best matching category for '{user_keyword}': {best_category} (similarity: {category_similarity:.3f})")
-        
-        # Step 2: Load the corresponding keyword trend phases CSV
-        csv_filename = f"third_layer_data/{best_category}_keyword_trend_phases.csv"
-        
-        if not os.path.exists(csv_filename):
-            return jsonify({
-                'error': f'Data file not found for category: {best_category}',
-                'category': best_category,
-                'category_similarity': category_similarity
-            }), 404
-        
-        # Load keyword data for the matched category
-        keyword_df = pd.read_csv(csv_filename)
-        
-        if keyword_df.empty:
-            return jsonify({
-                'error': f'No keyword data found for category: {best_category}',
-                'category': best_category,
-                'category_similarity': category_similarity
-            }), 404
-        
-        # Step 3: Find the closest keyword using embeddings
-        category_keywords = keyword_df['keyword'].tolist()
-        category_keyword_embeddings = model.encode(category_keywords)
-        
-        # Calculate cosine similarity with all keywords in the category
-        keyword_similarities = cosine_similarity(user_embedding, category_keyword_embeddings)[0]
-        best_keyword_idx = np.argmax(keyword_similarities)
-        best_keyword_match = category_keywords[best_keyword_idx]
-        keyword_similarity = float(keyword_similarities[best_keyword_idx])
-        
-        # Extract the trend data for the best matching keyword
-        keyword_data = keyword_df.iloc[best_keyword_idx]
-        
-        # Get LLM analysis for future trends
-        print(f"Getting LLM analysis for keyword: {user_keyword}")
-        llm_analysis = analyze_keyword_with_llm(
-            keyword=user_keyword,
-            category=best_category,
-            phase=keyword_data['phase'],
-            velocity=float(keyword_data['velocity']),
-            engagement_rate=float(keyword_data['engagement_rate']),
-            matched_keyword=best_keyword_match
-        )
-
-        result = {
-            'user_keyword': user_keyword,
-            'matched_category': best_category,
-            'category_similarity': round(category_similarity, 3),
-            'matched_keyword': best_keyword_match,
-            'keyword_similarity': round(keyword_similarity, 3),
-            'phase': keyword_data['phase'],
-            'velocity': float(keyword_data['velocity']),
-            'engagement_rate': float(keyword_data['engagement_rate']),
-            'velocity_description': f"{keyword_data['velocity']:.1f} mentions per month (past 3 months)",
-            'engagement_description': f"Popularity score: {keyword_data['engagement_rate']:.3f}",
-            'phase_description': get_phase_description(keyword_data['phase']),
-            # Add LLM analysis
-            'future_trend': llm_analysis['future_trend'],
-            'insights': llm_analysis['insights'],
-            'recommendations': llm_analysis['recommendations']
-        }
+        user_keyword, error_response = get_request_keyword()
+        if error_response:
+            return error_response
+        
+        match = find_keyword_match(data_snapshots.current, user_keyword)
+        if match is None:
+            return jsonify({'error': 'No keyword data available'}), 404
+        
+        # Add LLM analysis
+        result = dict(match)
+        result.update(get_keyword_analysis(match))
         
         print(f"Keyword checker result: {result}")
         return jsonify(result)
@@ -463,6 +680,101 @@ def keyword_checker():
         print(f"Error in keyword checker: {e}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@app.route('/api/keyword-checker/stream', methods=['POST'])
+def keyword_checker_stream():
+    """Stream the keyword match right away and the LLM analysis once ready, as NDJSON"""
+    try:
+        user_keyword, error_response = get_request_keyword()
+        if error_response:
+            return error_response
+        
+        match = find_keyword_match(data_snapshots.current, user_keyword)
+        if match is None:
+            return jsonify({'error': 'No keyword data available'}), 404
+    except Exception as e:
+        print(f"Error in keyword checker stream: {e}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+    
+    def generate():
+        yield json.dumps({'event': 'match', 'data': match}) + '\n'
+        try:
+            yield json.dumps({'event': 'analysis', 'data': get_keyword_analysis(match)}) + '\n'
+        except Exception as e:
+            print(f"Error streaming keyword analysis: {e}")
+            yield json.dumps({'event': 'error', 'error': f'Internal server error: {str(e)}'}) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/keyword-checker/batch', methods=['POST'])
+def keyword_checker_batch():
+    """Check a list of keywords with one batched encode and one index search"""
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get('keywords'), list):
+            return jsonify({'error': 'A list of keywords is required'}), 400
+        if not all(isinstance(keyword, str) for keyword in data['keywords']):
+            return jsonify({'error': 'Every keyword must be a string'}), 400
+        
+        user_keywords = [keyword.strip() for keyword in data['keywords']]
+        user_keywords = [keyword for keyword in user_keywords if keyword]
+        if not user_keywords:
+            return jsonify({'error': 'Keywords cannot be empty'}), 400
+        if len(user_keywords) > KEYWORD_BATCH_MAX:
+            return jsonify({'error': f'At most {KEYWORD_BATCH_MAX} keywords per batch'}), 400
+        
+        # Encode each distinct keyword once, in a single forward pass
+        unique_keywords = list(dict.fromkeys(user_keywords))
+        snapshot = data_snapshots.current
+        unique_embeddings = encode_queries(unique_keywords)
+        unique_matches = snapshot.keyword_index.search(unique_embeddings, k=KEYWORD_MATCH_TOP_K)
+        positions = {keyword: i for i, keyword in enumerate(unique_keywords)}
+        
+        results = []
+        for user_keyword in user_keywords:
+            i = positions[user_keyword]
+            match = build_keyword_match(snapshot, user_keyword, unique_embeddings[i], unique_matches[i])
+            results.append(match or {'user_keyword': user_keyword, 'error': 'No keyword data available'})
+        
+        analyze = bool(data.get('analyze', False))
+        if analyze:
+            # Only one LLM call per matched keyword, with a bounded number in flight
+            representatives = {}
+            for match in results:
+                if 'error' not in match:
+                    representatives.setdefault((match['matched_category'], match['matched_keyword']), match)
+            
+            with ThreadPoolExecutor(max_workers=LLM_BATCH_CONCURRENCY) as executor:
+                analyses = dict(zip(
+                    representatives.keys(),
+                    executor.map(get_keyword_analysis, representatives.values())
+                ))
+            
+            for match in results:
+                if 'error' not in match:
+                    match.update(analyses[(match['matched_category'], match['matched_keyword'])])
+        
+        return jsonify({
+            'count': len(results),
+            'analyzed': analyze,
+            'results': results
+        })
+        
+    except Exception as e:
+        print(f"Error in batch keyword checker: {e}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Get hit/miss counters for the LLM analysis and query embedding caches"""
+    return jsonify({
+        'llm_analysis': llm_cache.stats(),
+        'query_embeddings': query_embedding_cache.stats()
+    })
+
 def analyze_keyword_with_llm(keyword, category, phase, velocity, engagement_rate, matched_keyword):
     """Use Gemini to analyze keyword trends and provide insights"""
     if not llm:
@@ -472,6 +784,12 @@ def analyze_keyword_with_llm(keyword, category, phase, velocity, engagement_rate
             "recommendations": ["Monitor velocity changes", "Track engagement trends"]
         }
     
+    cache_key = llm_cache.make_key(matched_keyword, category, phase, velocity, engagement_rate)
+    cached_analysis = llm_cache.get(cache_key)
+    if cached_analysis is not None:
+        print(f"LLM cache hit for matched keyword: {matched_keyword}")
+        return cached_analysis
+    
     try:
         # Create a comprehensive prompt for trend analysis with metrics explanation
         prompt = f"""
@@ -519,6 +837,7 @@ def analyze_keyword_with_llm(keyword, category, phase, velocity, engagement_rate
         
         # Parse the response into structured format
         parsed_analysis = parse_llm_response_enhanced(analysis_text)
+        llm_cache.set(cache_key, parsed_analysis)
         
         return parsed_analysis
         
@@ -649,5 +968,17 @@ def get_phase_description(phase):
     }
     return descriptions.get(phase, f'This keyword is in the {phase} phase.')
 
+def init_worker():
+    """Per-process setup that cannot be shared copy-on-write across a fork"""
+    # The Gemini client holds network connections and the watcher is a thread,
+    # neither of which survives fork(), so each worker creates its own
+    init_llm()
+    data_snapshots.start()
+
+# With gunicorn preload (see gunicorn.conf.py) the master imports this module once
+# to share the model and data with every worker, and calls init_worker() after each fork
+if os.getenv('API_PRELOAD') != '1':
+    init_worker()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
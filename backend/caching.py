@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache with optional expiry and hit/miss counters"""
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.time() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class SQLiteCache:
+    """JSON values in a SQLite file that every worker process can share"""
+
+    def __init__(self, path, ttl=None, max_entries=10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Use a throwaway connection so no open handle is inherited across a fork
+        conn = sqlite3.connect(path, timeout=5)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # SQLite connections cannot be shared between threads, so keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        query = "SELECT value FROM cache WHERE key = ?"
+        params = [key]
+        if self.ttl is not None:
+            query += " AND created >= ?"
+            params.append(time.time() - self.ttl)
+
+        row = self._connect().execute(query, params).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now)
+            )
+            if self.ttl is not None:
+                conn.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        size = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {
+            'path': self.path,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class LLMAnalysisCache:
+    """Two-level cache of parsed Gemini analyses: per-process LRU in front of an optional shared SQLite store"""
+
+    def __init__(self, max_size=1024, ttl=None, path=None, disk_max_entries=10000,
+                 velocity_bucket=1.0, engagement_bucket=0.005):
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.disk = SQLiteCache(path, ttl=ttl, max_entries=disk_max_entries) if path else None
+        self.velocity_bucket = velocity_bucket
+        self.engagement_bucket = engagement_bucket
+
+    def make_key(self, matched_keyword, category, phase, velocity, engagement_rate):
+        """Key on the matched keyword and its trend data, with metrics rounded into buckets"""
+        key = [
+            matched_keyword.strip().lower(),
+            category,
+            phase,
+            round(velocity / self.velocity_bucket),
+            round(engagement_rate / self.engagement_bucket)
+        ]
+        return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"Error reading LLM cache: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except sqlite3.Error as e:
+                print(f"Error writing LLM cache: {e}")
+
+    def stats(self):
+        stats = {'memory': self.memory.stats()}
+        if self.disk is not None:
+            try:
+                stats['disk'] = self.disk.stats()
+            except sqlite3.Error as e:
+                stats['disk'] = {'error': str(e)}
+        return stats
+
+
+class PrecomputedResponse:
+    """A JSON payload serialized and gzipped once, identified by a strong ETag of its bytes"""
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        # mtime=0 keeps the compressed bytes identical across workers and reloads
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha1(self.body).hexdigest()
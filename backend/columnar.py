@@ -0,0 +1,300 @@
+"""
+Typed, compressed Parquet copies of the second- and third-layer CSVs.
+
+convert_directory() writes <name>.parquet next to each <name>.csv, plus an
+uncompressed <name>.arrow (Arrow IPC) copy for random row access, and records
+them in the directory's manifest.json (row count, schema, and the size, mtime
+and sha1 of the source CSV). read_table() serves the Parquet copy with column
+projection while it still matches its CSV, and take_rows()
+reads single rows from the memory-mapped Arrow copy. Both fall back to parsing
+the CSV otherwise, so stale or missing conversions never serve old data;
+load_rows() converts a stale table on first use so long-lived readers parse
+its CSV at most once.
+
+Usage:
+  python columnar.py convert [DIR ...]     # defaults to second_layer_data and third_layer_data
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ds = ipc = pq = None
+
+LAYER_DIRS = ['second_layer_data', 'third_layer_data']
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 2
+COMPRESSION = 'zstd'
+# Text columns with few distinct values, stored dictionary-encoded
+DICTIONARY_COLUMNS = ['category', 'phase']
+
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST_FILE)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'tables': {}}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'tables': {}}
+    return manifest
+
+
+def save_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def source_matches(entry, csv_path, check_hash=True):
+    """Whether a manifest entry was converted from the CSV as it is now"""
+    try:
+        stat = os.stat(csv_path)
+    except OSError:
+        return False
+    if stat.st_size != entry['source_size']:
+        return False
+    if stat.st_mtime_ns == entry['source_mtime_ns']:
+        return True
+    # A checkout or copy changes the mtime but not the contents
+    return check_hash and hash_file(csv_path) == entry['source_sha1']
+
+
+def convert_csv(csv_path, parquet_path, arrow_path):
+    """Parse a CSV once and write it as Parquet and Arrow IPC; returns the manifest entry"""
+    stat = os.stat(csv_path)
+    df = pd.read_csv(csv_path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name in DICTIONARY_COLUMNS:
+        field_type = table.schema.field(name).type if name in table.column_names else None
+        if field_type is not None and (pa.types.is_string(field_type) or pa.types.is_large_string(field_type)):
+            index = table.column_names.index(name)
+            table = table.set_column(index, name, table.column(name).dictionary_encode())
+
+    tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, parquet_path)
+    # Uncompressed, so a memory-mapped read only touches the pages of the rows taken
+    tmp_path = f"{arrow_path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, arrow_path)
+    return {
+        'file': os.path.basename(parquet_path),
+        'arrow_file': os.path.basename(arrow_path),
+        'rows': table.num_rows,
+        'columns': {field.name: str(field.type) for field in table.schema},
+        'bytes': os.path.getsize(parquet_path),
+        'source': os.path.basename(csv_path),
+        'source_size': stat.st_size,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_sha1': hash_file(csv_path),
+    }
+
+
+def _current_entry(directory, name, entry):
+    """The manifest entry when both copies exist and still match the CSV, else None"""
+    csv_path = os.path.join(directory, f"{name}.csv")
+    if entry is None or not os.path.exists(csv_path):
+        return None
+    for key in ('file', 'arrow_file'):
+        if not os.path.exists(os.path.join(directory, entry[key])):
+            return None
+    if not source_matches(entry, csv_path):
+        return None
+    # Record the current mtime so readers skip re-hashing an unchanged CSV
+    entry['source_mtime_ns'] = os.stat(csv_path).st_mtime_ns
+    return entry
+
+
+def _convert_table(directory, name):
+    entry = convert_csv(
+        os.path.join(directory, f"{name}.csv"),
+        os.path.join(directory, f"{name}.parquet"),
+        os.path.join(directory, f"{name}.arrow"),
+    )
+    print(f"Converted {name}.csv: {entry['rows']} rows, {entry['source_size']} -> {entry['bytes']} bytes")
+    return entry
+
+
+def convert_directory(directory, force=False):
+    """Convert every CSV in a directory whose Parquet copy is missing or stale"""
+    if pq is None:
+        raise ImportError("pyarrow is required to convert CSVs to Parquet")
+
+    manifest = load_manifest(directory)
+    tables = {}
+    for name in list_tables(directory):
+        entry = None if force else _current_entry(directory, name, manifest['tables'].get(name))
+        tables[name] = entry or _convert_table(directory, name)
+
+    # Drop copies of CSVs that no longer exist
+    for name in set(manifest['tables']) - set(tables):
+        for key in ('file', 'arrow_file'):
+            try:
+                os.remove(os.path.join(directory, manifest['tables'][name][key]))
+            except OSError:
+                pass
+
+    manifest['tables'] = tables
+    save_manifest(directory, manifest)
+    return manifest
+
+
+def convert_table(directory, name):
+    """Convert one CSV whose copies are missing or stale, leaving the rest of the manifest as is"""
+    if pq is None:
+        raise ImportError("pyarrow is required to convert CSVs to Parquet")
+
+    manifest = load_manifest(directory)
+    entry = _current_entry(directory, name, manifest['tables'].get(name))
+    manifest['tables'][name] = entry or _convert_table(directory, name)
+    save_manifest(directory, manifest)
+    return manifest
+
+
+def list_tables(directory, suffix=''):
+    """Names of the tables in a directory (CSV file names without .csv)"""
+    try:
+        filenames = sorted(os.listdir(directory))
+    except OSError:
+        return []
+    return [
+        filename[:-len('.csv')] for filename in filenames
+        if filename.endswith(f"{suffix}.csv")
+    ]
+
+
+def converted_path(directory, name, key='file', manifest=None):
+    """The table's Parquet (or arrow_file) copy, or None when it is missing or older than its CSV"""
+    if pq is None:
+        return None
+    manifest = manifest if manifest is not None else load_manifest(directory)
+    entry = manifest['tables'].get(name)
+    if entry is None:
+        return None
+    path = os.path.join(directory, entry[key])
+    if not os.path.exists(path) or not source_matches(entry, os.path.join(directory, f"{name}.csv")):
+        return None
+    return path
+
+
+def _to_pandas(table):
+    # Dictionary columns come back as plain strings, like the CSV
+    return table.to_pandas().astype({
+        field.name: 'str' for field in table.schema if pa.types.is_dictionary(field.type)
+    })
+
+
+def read_table(directory, name, columns=None, limit=None, manifest=None):
+    """
+    Read one table as a DataFrame. columns projects and limit keeps the first
+    rows. The Parquet copy is used when it is current; otherwise the CSV is
+    parsed.
+    """
+    parquet_path = converted_path(directory, name, manifest=manifest)
+    if parquet_path is None:
+        df = pd.read_csv(os.path.join(directory, f"{name}.csv"), usecols=columns, nrows=limit)
+        return df if columns is None else df[list(columns)]
+
+    dataset = ds.dataset(parquet_path, format='parquet')
+    if limit is not None:
+        table = dataset.head(limit, columns=columns)
+    else:
+        table = dataset.to_table(columns=columns)
+    return _to_pandas(table)
+
+
+def open_rows(directory, name, manifest=None):
+    """The table's memory-mapped Arrow copy, or None when it is missing or older than its CSV"""
+    arrow_path = converted_path(directory, name, key='arrow_file', manifest=manifest)
+    if arrow_path is None:
+        return None
+    return ipc.open_file(pa.memory_map(arrow_path)).read_all()
+
+
+def load_rows(directory, name, manifest=None):
+    """
+    A table to take rows from for as long as the caller holds it. The Arrow
+    copy is written first when it is missing or stale; where it cannot be
+    (no pyarrow, or a read-only directory) the CSV is parsed once and the
+    table is kept in memory instead.
+    """
+    table = open_rows(directory, name, manifest)
+    if table is not None:
+        return table
+    if pq is not None:
+        try:
+            return open_rows(directory, name, convert_table(directory, name))
+        except OSError as e:
+            print(f"Could not convert {name}.csv, keeping it in memory: {e}")
+    df = pd.read_csv(os.path.join(directory, f"{name}.csv"))
+    return df if pa is None else pa.Table.from_pandas(df, preserve_index=False)
+
+
+def take_rows(directory, name, rows, columns=None, manifest=None, table=None):
+    """
+    Rows at the given positions, in that order. table is a table already
+    returned by open_rows() or load_rows(); a mapped file is only read where
+    the rows are.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if table is None:
+        table = open_rows(directory, name, manifest)
+    if table is None:
+        table = pd.read_csv(os.path.join(directory, f"{name}.csv"), usecols=columns)
+    if isinstance(table, pd.DataFrame):
+        df = table if columns is None else table[columns]
+        return df.iloc[rows].reset_index(drop=True)
+
+    if columns is not None:
+        table = table.select(columns)
+    return _to_pandas(table.take(pa.array(rows)))
+
+
+def take_records(directory, name, rows, manifest=None, table=None):
+    """take_rows() as a list of dicts, built straight from Arrow when the copy is current"""
+    if table is None:
+        table = open_rows(directory, name, manifest)
+    if table is None or isinstance(table, pd.DataFrame):
+        return take_rows(directory, name, rows, manifest=manifest, table=table).to_dict('records')
+    return table.take(pa.array(np.asarray(rows, dtype=np.int64))).to_pylist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert data CSVs to Parquet with a manifest")
+    parser.add_argument('command', choices=['convert'])
+    parser.add_argument('directories', nargs='*', help="directories of CSVs (default: the layer data directories)")
+    parser.add_argument('--force', action='store_true', help="reconvert even when the Parquet copy is current")
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    directories = args.directories or [os.path.join(base_dir, directory) for directory in LAYER_DIRS]
+    for directory in directories:
+        manifest = convert_directory(directory, force=args.force)
+        print(f"{directory}: {len(manifest['tables'])} tables in {MANIFEST_FILE}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+Pluggable sentence embedding backends shared by api.py and models/main.py.
+
+EMBEDDING_BACKEND selects the implementation:
+  sentence-transformers  fp32 PyTorch through SentenceTransformer (api.py default)
+  torch                  fp32 PyTorch AutoModel (models/main.py default)
+  onnx                   ONNX Runtime on CPU, exported from the same checkpoint;
+                         EMBEDDING_QUANTIZE=1 uses the int8 dynamically quantized model
+
+Usage:
+  python embedding_backend.py export            # export fp32 + int8 ONNX models
+  python embedding_backend.py parity            # cosine agreement vs. torch
+  python embedding_backend.py bench             # texts/sec for every backend
+"""
+import argparse
+import inspect
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_DIR = os.getenv(
+    'EMBEDDING_ONNX_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx_models')
+)
+# SentenceTransformer truncates all-MiniLM-L6-v2 inputs at 256 tokens
+MAX_LENGTH = 256
+
+
+def onnx_model_path(model_name=MODEL_NAME, quantize=False, onnx_dir=ONNX_DIR):
+    filename = 'model.int8.onnx' if quantize else 'model.onnx'
+    return os.path.join(onnx_dir, model_name.replace('/', '__'), filename)
+
+
+def mean_pool(last_hidden_state, attention_mask):
+    """Average token embeddings, ignoring padding positions"""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (last_hidden_state * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def export_onnx(model_name=MODEL_NAME, onnx_dir=ONNX_DIR, quantize=True):
+    """Export the transformer to ONNX and optionally write an int8 dynamically quantized copy"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_path = onnx_model_path(model_name, quantize=False, onnx_dir=onnx_dir)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    encoded = tokenizer(["an example sentence for export"], return_tensors="pt")
+
+    input_names = ['input_ids', 'attention_mask', 'token_type_ids']
+    output_names = ['last_hidden_state', 'pooler_output']
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    dynamic_axes['pooler_output'] = {0: 'batch'}
+
+    export_kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # Newer torch defaults to the dynamo exporter; keep the TorchScript one
+        export_kwargs['dynamo'] = False
+
+    print(f"Exporting {model_name} to {output_path}...")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(encoded[name] for name in input_names),
+            output_path,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = onnx_model_path(model_name, quantize=True, onnx_dir=onnx_dir)
+        print(f"Quantizing to {quantized_path}...")
+        quantize_dynamic(output_path, quantized_path, weight_type=QuantType.QInt8)
+
+    return output_path
+
+
+class TorchEmbedder:
+    """fp32 PyTorch AutoModel with masked mean pooling"""
+
+    def __init__(self, model_name=MODEL_NAME, device=None):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        self.torch = torch
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.device = device or torch.device('cpu')
+        self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
+
+    def encode(self, texts, batch_size=64, max_length=MAX_LENGTH, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                list(texts[start:start + batch_size]),
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="pt",
+            ).to(self.device)
+            with self.torch.no_grad():
+                hidden = self.model(**encoded).last_hidden_state
+            batches.append(mean_pool(hidden.cpu().numpy(), encoded['attention_mask'].cpu().numpy()))
+        return np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+
+class OnnxEmbedder:
+    """
+    ONNX Runtime CPU session with masked mean pooling.
+
+    Calling the embedder with tokenizer output mirrors the HF AutoModel forward
+    call, so it can stand in for the torch model in models/main.py.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, quantize=False, onnx_dir=ONNX_DIR, num_threads=None):
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.path = onnx_model_path(model_name, quantize=quantize, onnx_dir=onnx_dir)
+        self.num_threads = int(num_threads if num_threads is not None else os.getenv('ORT_NUM_THREADS', '0'))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        if not os.path.exists(self.path):
+            export_onnx(model_name, onnx_dir=onnx_dir, quantize=quantize)
+
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self):
+        # ONNX Runtime thread pools do not survive fork(), so each process
+        # (e.g. every preloaded gunicorn worker) opens its own session
+        if self._session is None or self._session_pid != os.getpid():
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = self.num_threads
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self._session = ort.InferenceSession(self.path, options, providers=['CPUExecutionProvider'])
+            self._input_names = [i.name for i in self._session.get_inputs()]
+            self._session_pid = os.getpid()
+        return self._session
+
+    def run(self, input_ids, attention_mask, token_type_ids=None):
+        """Return last_hidden_state for already tokenized int64 arrays"""
+        session = self.session
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if token_type_ids is None:
+            token_type_ids = np.zeros_like(input_ids)
+        inputs['token_type_ids'] = token_type_ids
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in self._input_names}
+        return session.run(['last_hidden_state'], feed)[0]
+
+    def __call__(self, **encoded):
+        import torch
+
+        arrays = {name: tensor.cpu().numpy() for name, tensor in encoded.items()}
+        hidden = self.run(**arrays)
+        return SimpleNamespace(last_hidden_state=torch.from_numpy(hidden))
+
+    def encode(self, texts, batch_size=64, max_length=MAX_LENGTH, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                list(texts[start:start + batch_size]),
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="np",
+            )
+            hidden = self.run(**encoded)
+            batches.append(mean_pool(hidden, encoded['attention_mask']))
+        return np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+
+def load_embedder(backend=None, model_name=MODEL_NAME, quantize=None):
+    """Create the embedding backend selected by EMBEDDING_BACKEND / EMBEDDING_QUANTIZE"""
+    backend = backend or os.getenv('EMBEDDING_BACKEND', 'sentence-transformers')
+    if quantize is None:
+        quantize = os.getenv('EMBEDDING_QUANTIZE', '0') == '1'
+
+    if backend == 'onnx':
+        return OnnxEmbedder(model_name, quantize=quantize)
+    if backend == 'torch':
+        return TorchEmbedder(model_name)
+    if backend == 'sentence-transformers':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def sample_texts(limit=512):
+    """Short keywords and long video texts from the repo's data, for parity and benchmarks"""
+    from columnar import list_tables, read_table
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    texts = []
+    third_layer = os.path.join(base_dir, 'third_layer_data')
+    for name in list_tables(third_layer):
+        texts.extend(read_table(third_layer, name, columns=['keyword'])['keyword'].astype(str).tolist())
+    second_layer = os.path.join(base_dir, 'second_layer_data')
+    for name in list_tables(second_layer):
+        df = read_table(second_layer, name, columns=['clean_text'], limit=limit // 10)
+        texts.extend(df['clean_text'].dropna().astype(str).tolist())
+    return texts[:limit]
+
+
+def parity_check(texts, reference, candidate, min_cosine=0.99):
+    """Cosine agreement between two backends' embeddings of the same texts"""
+    expected = reference.encode(texts)
+    actual = candidate.encode(texts)
+    cosines = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1) + 1e-12
+    )
+    return {
+        'texts': len(texts),
+        'mean_cosine': float(cosines.mean()),
+        'min_cosine': float(cosines.min()),
+        'passed': bool(cosines.min() >= min_cosine)
+    }
+
+
+def benchmark(embedder, texts, batch_size=64, repeats=3):
+    """Best-of-N throughput in texts per second"""
+    embedder.encode(texts[:batch_size], batch_size=batch_size)  # warm up
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        embedder.encode(texts, batch_size=batch_size)
+        best = min(best, time.perf_counter() - started)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export, validate and benchmark embedding backends")
+    parser.add_argument('command', choices=['export', 'parity', 'bench'])
+    parser.add_argument('--model', default=MODEL_NAME)
+    parser.add_argument('--limit', type=int, default=512, help="number of sample texts")
+    parser.add_argument('--batch-size', type=int, default=64)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_onnx(args.model, quantize=True)
+        return
+
+    texts = sample_texts(args.limit)
+    reference = TorchEmbedder(args.model)
+    candidates = {
+        'onnx': OnnxEmbedder(args.model, quantize=False),
+        'onnx-int8': OnnxEmbedder(args.model, quantize=True),
+    }
+
+    if args.command == 'parity':
+        failed = False
+        for name, candidate in candidates.items():
+            # Dynamic int8 quantization trades a little accuracy for speed
+            result = parity_check(texts, reference, candidate, min_cosine=0.97 if 'int8' in name else 0.999)
+            failed = failed or not result['passed']
+            print(f"{name}: {result}")
+        raise SystemExit(1 if failed else 0)
+
+    timings = {'torch': benchmark(reference, texts, args.batch_size)}
+    for name, candidate in candidates.items():
+        timings[name] = benchmark(candidate, texts, args.batch_size)
+    for name, texts_per_second in timings.items():
+        print(f"{name:>10}: {texts_per_second:8.1f} texts/s ({texts_per_second / timings['torch']:.2f}x torch)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Gunicorn settings for the Beauty Scope API.
+
+With preload enabled (the default), the master imports api.py once: the
+SentenceTransformer weights, keyword index and data snapshot are loaded a
+single time and shared copy-on-write by every forked worker. Anything that
+does not survive fork() is created per worker in post_fork via
+api.init_worker(). Master and worker startup time, RSS and PSS are logged
+so the effect of adding workers can be measured on the target box;
+DEPLOYMENT.md lists the numbers measured with 2 and 8 workers.
+"""
+import gc
+import os
+import time
+
+_config_loaded_at = time.time()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = 120
+accesslog = '-'
+errorlog = '-'
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+# Intra-op threads per worker, so N workers do not oversubscribe the CPU
+torch_threads = int(os.getenv('TORCH_NUM_THREADS', max(1, (os.cpu_count() or 1) // workers)))
+
+if preload_app:
+    # api.py defers per-worker setup to post_fork when this is set
+    os.environ['API_PRELOAD'] = '1'
+    # Keep the master single-threaded: OpenMP and the tokenizers' Rust thread
+    # pool are not fork-safe once they have started worker threads
+    os.environ.setdefault('OMP_NUM_THREADS', '1')
+    os.environ.setdefault('MKL_NUM_THREADS', '1')
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+
+def memory_usage_mb():
+    """Return (rss, pss) of the current process in MB; PSS splits shared pages between processes"""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                if key in ('Rss', 'Pss'):
+                    usage[key] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        import resource
+        usage['Rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return usage.get('Rss'), usage.get('Pss')
+
+
+def format_memory():
+    rss, pss = memory_usage_mb()
+    pss_text = f", PSS {pss:.0f} MB" if pss is not None else ""
+    return f"RSS {rss:.0f} MB{pss_text}"
+
+
+def when_ready(server):
+    server.log.info(
+        "Master ready in %.1fs (%s, preload=%s, workers=%d, torch threads/worker=%d)",
+        time.time() - _config_loaded_at, format_memory(), preload_app, workers, torch_threads
+    )
+    if preload_app:
+        # Move everything loaded so far out of the GC's reach, so collections in
+        # the workers do not write to (and un-share) those pages
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.time()
+
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    if preload_app:
+        import api
+        api.init_worker()
+
+
+def post_worker_init(worker):
+    worker.log.info(
+        "Worker %s ready in %.2fs after fork (%s)",
+        worker.pid, time.time() - worker.forked_at, format_memory()
+    )
@@ -0,0 +1,214 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar import load_manifest, read_table
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+PHASES_GLOB = 'third_layer_data/*_keyword_trend_phases.csv'
+PHASES_SUFFIX = '_keyword_trend_phases.csv'
+INDEX_FILE = 'outputs/keyword_index.npz'
+RECORD_COLUMNS = ['keyword', 'velocity', 'engagement_rate', 'phase']
+
+# Exact brute-force search is used below this many keywords, an HNSW index above it
+ANN_THRESHOLD = int(os.getenv('KEYWORD_ANN_THRESHOLD', '20000'))
+
+
+def normalize_rows(embeddings):
+    """Return float32 embeddings scaled to unit length so cosine similarity is a dot product"""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def build_ann(embeddings):
+    """Build an HNSW inner product index over unit-length embeddings, labelled by row"""
+    ann = hnswlib.Index(space='ip', dim=embeddings.shape[1])
+    ann.init_index(max_elements=len(embeddings), ef_construction=200, M=16)
+    ann.add_items(embeddings, np.arange(len(embeddings)))
+    return ann
+
+
+def ann_search(ann, queries, k, ef):
+    """Return the approximate top-k rows and cosine similarities for each query"""
+    ann.set_ef(ef)
+    labels, distances = ann.knn_query(queries, k=k)
+    # hnswlib's 'ip' space reports distance as 1 - inner product, which for
+    # unit-length vectors is 1 - cosine similarity
+    return labels.astype(np.int64), 1.0 - distances
+
+
+def phase_files(pattern=PHASES_GLOB):
+    """Map each category to its keyword trend phases CSV"""
+    files = {}
+    for file_path in sorted(glob.glob(pattern)):
+        category = os.path.basename(file_path)[:-len(PHASES_SUFFIX)]
+        files[category] = file_path
+    return files
+
+
+def fingerprint_files(files, model_name):
+    """Hash the model name and the contents of every phase file"""
+    digest = hashlib.sha1(model_name.encode('utf-8'))
+    for category, file_path in sorted(files.items()):
+        digest.update(category.encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            digest.update(hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()
+
+
+class KeywordIndex:
+    """Normalized embeddings for every third-layer keyword across all categories"""
+
+    def __init__(self, records, embeddings, fingerprint, ann_threshold=ANN_THRESHOLD):
+        self.records = records.reset_index(drop=True)
+        self.embeddings = normalize_rows(embeddings)
+        self.fingerprint = fingerprint
+        self.keywords = self.records['keyword'].tolist()
+        self.categories = self.records['category'].tolist()
+
+        categories = self.records['category'].to_numpy()
+        self.category_rows = {
+            category: np.flatnonzero(categories == category)
+            for category in pd.unique(categories)
+        }
+
+        self.ann = None
+        if len(self) >= ann_threshold:
+            self.ann = self._build_ann()
+
+    def _build_ann(self):
+        """Build an HNSW index over the embeddings, or fall back to exact search"""
+        if hnswlib is None:
+            print("hnswlib is not installed, using exact keyword search")
+            return None
+
+        ann = build_ann(self.embeddings)
+        print(f"Built approximate keyword index over {len(self)} keywords")
+        return ann
+
+    def __len__(self):
+        return len(self.records)
+
+    def record(self, row):
+        """Return the trend phase record stored at a given row"""
+        return self.records.iloc[int(row)].to_dict()
+
+    def search(self, query_embeddings, k=5):
+        """Return the top-k keywords for each query as keyword, category and score"""
+        queries = normalize_rows(query_embeddings)
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        if self.ann is not None:
+            rows, scores = ann_search(self.ann, queries, k, ef=max(64, k * 4))
+        else:
+            similarities = queries @ self.embeddings.T
+            if k < len(self):
+                rows = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            else:
+                rows = np.tile(np.arange(len(self)), (len(queries), 1))
+            scores = np.take_along_axis(similarities, rows, axis=1)
+            order = np.argsort(-scores, axis=1)
+            rows = np.take_along_axis(rows, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+
+        return [
+            [
+                {
+                    'row': int(row),
+                    'keyword': self.keywords[row],
+                    'category': self.categories[row],
+                    'score': float(score)
+                }
+                for row, score in zip(query_rows, query_scores)
+            ]
+            for query_rows, query_scores in zip(rows, scores)
+        ]
+
+    def save(self, path=INDEX_FILE):
+        """Persist the index atomically so concurrent workers never read a partial file"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                fingerprint=np.array(self.fingerprint),
+                embeddings=self.embeddings,
+                category=self.records['category'].to_numpy(dtype=str),
+                keyword=self.records['keyword'].to_numpy(dtype=str),
+                velocity=self.records['velocity'].to_numpy(dtype=np.float64),
+                engagement_rate=self.records['engagement_rate'].to_numpy(dtype=np.float64),
+                phase=self.records['phase'].to_numpy(dtype=str),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with np.load(path, allow_pickle=False) as data:
+            records = pd.DataFrame({
+                'category': data['category'],
+                'keyword': data['keyword'],
+                'velocity': data['velocity'],
+                'engagement_rate': data['engagement_rate'],
+                'phase': data['phase'],
+            })
+            return cls(records, data['embeddings'], str(data['fingerprint']))
+
+    @classmethod
+    def build(cls, files, encode, fingerprint):
+        """Read every phase file once and encode all keywords in a single batch"""
+        frames = []
+        manifests = {}
+        for category, file_path in files.items():
+            directory = os.path.dirname(file_path)
+            if directory not in manifests:
+                manifests[directory] = load_manifest(directory)
+            name = os.path.basename(file_path)[:-len('.csv')]
+            df = read_table(directory, name, columns=RECORD_COLUMNS, manifest=manifests[directory])
+            df['keyword'] = df['keyword'].astype(str)
+            df['category'] = category
+            frames.append(df)
+
+        if frames:
+            records = pd.concat(frames, ignore_index=True)
+        else:
+            records = pd.DataFrame(columns=['category'] + RECORD_COLUMNS)
+
+        if len(records):
+            embeddings = encode(records['keyword'].tolist())
+        else:
+            embeddings = np.zeros((0, 1), dtype=np.float32)
+        return cls(records, embeddings, fingerprint)
+
+
+def load_keyword_index(encode, model_name, pattern=PHASES_GLOB, path=INDEX_FILE):
+    """Load the persisted keyword index, rebuilding it when the phase files or model changed"""
+    files = phase_files(pattern)
+    fingerprint = fingerprint_files(files, model_name)
+
+    if os.path.exists(path):
+        try:
+            index = KeywordIndex.load(path)
+            if index.fingerprint == fingerprint:
+                print(f"Loaded keyword index with {len(index)} keywords from {path}")
+                return index
+            print("Keyword index is stale, rebuilding...")
+        except Exception as e:
+            print(f"Error loading keyword index: {e}")
+
+    index = KeywordIndex.build(files, encode, fingerprint)
+    try:
+        index.save(path)
+    except Exception as e:
+        print(f"Error saving keyword index: {e}")
+    print(f"Built keyword index with {len(index)} keywords across {len(index.category_rows)} categories")
+    return index
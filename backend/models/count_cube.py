@@ -0,0 +1,180 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def month_labels(start, count):
+    return [f"{m // 12:04d}-{m % 12 + 1:02d}" for m in range(start, start + count)]
+
+
+def cell_matrices(rows, columns, shape, values):
+    """
+    Per-cell sums of each array in values as CSR matrices that share one
+    sparsity structure, with each row's columns in ascending order.
+    """
+    order = np.lexsort((columns, rows))
+    rows, columns = rows[order], columns[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+    starts = np.flatnonzero(first)
+    indices = columns[starts]
+    indptr = np.searchsorted(rows[starts], np.arange(shape[0] + 1))
+    return [
+        sparse.csr_matrix(
+            (np.add.reduceat(value[order], starts) if len(starts) else value[:0], indices, indptr), shape=shape
+        )
+        for value in values
+    ]
+
+
+class KeywordMonthCube:
+    """
+    Mention counts for every (category, keyword) pair by calendar month, built
+    with a single groupby. Rows keep the pairs' first-seen order; columns are
+    consecutive months starting at month_start (year * 12 + month - 1).
+
+    totals holds optional per-cell sums of other row values (engagement, say).
+    Each shares the counts' sparsity structure, so totals[name].data[i] is the
+    same cell as counts.data[i], and add() merges them with the counts.
+    """
+
+    def __init__(self, categories, keywords, month_start, counts, totals=None):
+        self.categories = list(categories)
+        self.keywords = list(keywords)
+        self.month_start = int(month_start)
+        self.counts = sparse.csr_matrix(counts, dtype=np.int64)
+        self.totals = {name: sparse.csr_matrix(value, dtype=np.float64) for name, value in (totals or {}).items()}
+        self.months = month_labels(self.month_start, self.counts.shape[1])
+        self._rows = {pair: i for i, pair in enumerate(zip(self.categories, self.keywords))}
+        self._category_rows = {}
+        for i, category in enumerate(self.categories):
+            self._category_rows.setdefault(category, []).append(i)
+
+    def __len__(self):
+        return len(self.keywords)
+
+    @classmethod
+    def build(cls, df, category_col="category", keyword_col="keywords", date_col="publishedAt", totals=None):
+        """totals maps names to per-row values (a column name or an array aligned with df) to sum per cell"""
+        groups = df.groupby([category_col, keyword_col], sort=False)
+        codes = groups.ngroup().to_numpy()
+        pairs = groups.size().index.tolist()
+
+        dates = pd.to_datetime(df[date_col], errors="coerce")
+        valid = dates.notna().to_numpy() & (codes >= 0)
+        month = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()[valid].astype(np.int64)
+        month_start = int(month.min()) if len(month) else 0
+        n_months = int(month.max()) - month_start + 1 if len(month) else 0
+
+        totals = totals or {}
+        values = [
+            np.asarray(df[value] if isinstance(value, str) else value, dtype=np.float64)[valid]
+            for value in totals.values()
+        ]
+        counts, *sums = cell_matrices(
+            codes[valid], month - month_start, (len(pairs), n_months), [np.ones(len(month), dtype=np.int64), *values]
+        )
+        categories = [category for category, _ in pairs]
+        keywords = [keyword for _, keyword in pairs]
+        return cls(categories, keywords, month_start, counts, dict(zip(totals, sums)))
+
+    def add(self, other):
+        """
+        A cube with other's counts and totals added to this one's. Pairs new to
+        this cube are appended in other's order, so existing rows keep their index.
+        """
+        if set(other.totals) != set(self.totals):
+            raise ValueError("Cubes must have the same totals to be added")
+        categories, keywords, rows = list(self.categories), list(self.keywords), dict(self._rows)
+        other_rows = np.empty(len(other), dtype=np.int64)
+        for i, pair in enumerate(zip(other.categories, other.keywords)):
+            if pair not in rows:
+                rows[pair] = len(categories)
+                categories.append(pair[0])
+                keywords.append(pair[1])
+            other_rows[i] = rows[pair]
+
+        # Every non-zero cell of both cubes as (row, absolute month, count, totals)
+        cube_rows, months, values = [], [], [[] for _ in range(1 + len(self.totals))]
+        for cube, row_map in ((self, np.arange(len(self), dtype=np.int64)), (other, other_rows)):
+            cube_rows.append(np.repeat(row_map, np.diff(cube.counts.indptr)))
+            months.append(cube.counts.indices.astype(np.int64) + cube.month_start)
+            for target, matrix in zip(values, [cube.counts, *(cube.totals[name] for name in self.totals)]):
+                target.append(matrix.data)
+        cube_rows, months = np.concatenate(cube_rows), np.concatenate(months)
+        month_start = int(months.min()) if len(months) else 0
+        n_months = int(months.max()) - month_start + 1 if len(months) else 0
+
+        counts, *sums = cell_matrices(
+            cube_rows, months - month_start, (len(categories), n_months), [np.concatenate(value) for value in values]
+        )
+        return KeywordMonthCube(categories, keywords, month_start, counts, dict(zip(self.totals, sums)))
+
+    def row(self, category, keyword):
+        return self._rows.get((category, keyword))
+
+    def rows_for(self, category):
+        """Row indices of a category's keywords, in first-seen order"""
+        return self._category_rows.get(category, [])
+
+    def series(self, row):
+        """
+        Monthly counts from the keyword's first to last active month, zero-filled,
+        like resample("M").size() on its videos' publish dates.
+        """
+        start, end = self.counts.indptr[row], self.counts.indptr[row + 1]
+        columns = self.counts.indices[start:end]
+        if len(columns) == 0:
+            return pd.Series([], dtype=np.int64)
+        first, last = columns.min(), columns.max()
+        values = np.zeros(last - first + 1, dtype=np.int64)
+        values[columns - first] = self.counts.data[start:end]
+        return pd.Series(values)
+
+    def to_frame(self):
+        """Long (category, keyword, month, count) table of the non-zero cells"""
+        coo = self.counts.tocoo()
+        return pd.DataFrame({
+            "category": np.asarray(self.categories, dtype=object)[coo.row],
+            "keyword": np.asarray(self.keywords, dtype=object)[coo.row],
+            "month": np.asarray(self.months, dtype=object)[coo.col],
+            "count": coo.data,
+        })
+
+    def arrays(self):
+        """The cube as named arrays, for np.savez alongside other state"""
+        arrays = {
+            "categories": np.asarray(self.categories, dtype=str),
+            "keywords": np.asarray(self.keywords, dtype=str),
+            "month_start": self.month_start,
+            "data": self.counts.data,
+            "indices": self.counts.indices,
+            "indptr": self.counts.indptr,
+            "shape": np.asarray(self.counts.shape),
+        }
+        for name, matrix in self.totals.items():
+            arrays[f"total_{name}"] = matrix.data
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, data):
+        shape = tuple(data["shape"])
+        counts = sparse.csr_matrix((data["data"], data["indices"], data["indptr"]), shape=shape)
+        totals = {
+            key[len("total_"):]: sparse.csr_matrix((data[key], data["indices"], data["indptr"]), shape=shape)
+            for key in data.keys() if key.startswith("total_")
+        }
+        return cls(data["categories"].tolist(), data["keywords"].tolist(), data["month_start"], counts, totals)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **self.arrays())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls.from_arrays(data)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+KEY_DTYPE = "S20"  # raw sha1 digest
+KEY_SIZE = np.dtype(KEY_DTYPE).itemsize
+
+
+class EmbeddingStore:
+    """
+    Content-addressed embedding cache: one float32 row per distinct text, keyed by
+    sha1(model_key + text). Each model key gets its own directory, so changing the
+    model, backend or pooling never serves stale vectors.
+
+    The store is append-only. Vectors are appended in place to a raw float32 file
+    before their keys are appended to a raw file of digests, so a run interrupted
+    between the two leaves extra rows past the last key, and one interrupted
+    mid-write a partial last key; both are ignored and truncated by the next add().
+    Nothing already stored is rewritten or re-sorted when rows are added.
+    """
+
+    def __init__(self, directory, model_key):
+        self.model_key = model_key
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model_key)
+        digest = hashlib.sha1(model_key.encode("utf-8")).hexdigest()[:8]
+        self.directory = os.path.join(directory, f"{slug}-{digest}")
+        self.keys_path = os.path.join(self.directory, "keys.s20")
+        # Stores written before keys were appended in place kept them in a .npy file
+        self.legacy_keys_path = os.path.join(self.directory, "keys.npy")
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self._load()
+
+    def _load(self):
+        self.vectors = None
+        self.keys = np.zeros(0, dtype=KEY_DTYPE)
+        self._dim = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self._dim = json.load(f)["dim"]
+            if not os.path.exists(self.keys_path) and os.path.exists(self.legacy_keys_path):
+                np.load(self.legacy_keys_path).astype(KEY_DTYPE).tofile(self.keys_path)
+            if os.path.exists(self.keys_path):
+                count = os.path.getsize(self.keys_path) // KEY_SIZE
+                self.keys = np.fromfile(self.keys_path, dtype=KEY_DTYPE, count=count)
+        self._order = np.argsort(self.keys, kind="stable")
+        self._sorted_keys = self.keys[self._order]
+        self._map_vectors()
+
+    def _map_vectors(self):
+        self.vectors = None
+        if len(self.keys):
+            self.vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.keys), self._dim)
+            )
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def dim(self):
+        return self._dim
+
+    def keys_for(self, texts):
+        prefix = self.model_key.encode("utf-8") + b"\0"
+        return np.array(
+            [hashlib.sha1(prefix + str(text).encode("utf-8")).digest() for text in texts],
+            dtype=KEY_DTYPE,
+        )
+
+    def lookup(self, keys):
+        """Row position of each key in the store, or -1 when it has not been embedded yet"""
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        idx = np.searchsorted(self._sorted_keys, keys)
+        idx = np.minimum(idx, len(self._sorted_keys) - 1)
+        found = self._sorted_keys[idx] == keys
+        return np.where(found, self._order[idx], -1).astype(np.int64)
+
+    def add(self, keys, vectors):
+        """Append new (key, vector) rows and persist them"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.meta_path):
+            with open(self.meta_path, "w") as f:
+                json.dump({"dim": int(vectors.shape[1]), "dtype": "float32"}, f)
+            self._dim = int(vectors.shape[1])
+
+        # Drop rows left behind by an interrupted add() before appending
+        self.vectors = None
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(len(self.keys) * self._dim * 4)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        keys = np.asarray(keys, dtype=KEY_DTYPE)
+        with open(self.keys_path, "ab") as f:
+            f.truncate(len(self.keys) * KEY_SIZE)
+            f.write(keys.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Merge the new keys into the sorted index instead of re-sorting every key
+        order = np.argsort(keys, kind="stable")
+        at = np.searchsorted(self._sorted_keys, keys[order], side="right")
+        self._sorted_keys = np.insert(self._sorted_keys, at, keys[order])
+        self._order = np.insert(self._order, at, len(self.keys) + order)
+        self.keys = np.concatenate([self.keys, keys])
+        self._map_vectors()
+
+    def get(self, positions):
+        return np.asarray(self.vectors[positions], dtype=np.float32)
@@ -0,0 +1,249 @@
+"""
+Additive-trend (Holt) exponential smoothing for many keyword series at once.
+
+fit_holt() evaluates a grid of (alpha, beta) smoothing parameters for every
+series in one set of array operations. For fixed smoothing parameters the
+one-step errors are linear in the initial level and trend, so those are
+solved exactly by least squares instead of being searched. forecast_keyword()
+is the original per-keyword statsmodels fit, kept as the reference path.
+
+Usage:
+  python holt.py parity            # compare against statsmodels on the saved count cube
+  python holt.py parity --synthetic   # same check on fixed synthetic series, no data needed
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from count_cube import KeywordMonthCube
+from pools import process_pool
+
+MIN_OBSERVATIONS = 6
+GRID_SIZE = int(os.getenv("HOLT_GRID_SIZE", "21"))
+# Series fitted together per batch; memory is about batch x grid points x 80 bytes
+BATCH_SIZE = 2048
+COUNTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "outputs", "keyword_month_counts.npz")
+
+
+def classify(keyword, last_actual, last_forecast):
+    growth_rate = (last_forecast - last_actual) / (last_actual + 1e-6)
+
+    if growth_rate > 0.1:
+        trend = "up"
+    elif growth_rate < -0.1:
+        trend = "down"
+    else:
+        trend = "stable"
+
+    return {"keyword": keyword, "trend": trend, "growth_rate": float(growth_rate)}
+
+
+def fit_statsmodels(keyword, counts, periods=6):
+    """forecast_keyword() result and the fit's squared error (None when not fitted)"""
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    if len(counts) < MIN_OBSERVATIONS:
+        return {"keyword": keyword, "trend": "no_data", "growth_rate": 0}, None
+
+    try:
+        model = ExponentialSmoothing(counts, trend="add", seasonal=None)
+        fit = model.fit()
+        forecast = fit.forecast(periods)
+    except Exception as e:
+        print(f"⚠️ Forecast failed for {keyword}: {e}")
+        return {"keyword": keyword, "trend": "error", "growth_rate": 0}, None
+
+    return classify(keyword, counts.iloc[-1], forecast.iloc[-1]), float(fit.sse)
+
+
+def forecast_keyword(keyword, counts, periods=6):
+    """Forecast trend for a single keyword from its monthly mention counts."""
+    return fit_statsmodels(keyword, counts, periods)[0]
+
+
+def smoothing_grid(grid_size=GRID_SIZE):
+    """(alpha, beta) pairs with 0 <= beta <= alpha <= 1, the region statsmodels searches"""
+    levels = np.linspace(0.0, 1.0, grid_size)
+    alpha, beta = np.meshgrid(levels, levels, indexing="ij")
+    admissible = beta <= alpha
+    return alpha[admissible], beta[admissible]
+
+
+def fit_holt(values, lengths, grid_size=GRID_SIZE):
+    """
+    Fit additive Holt smoothing to each row of values (left-aligned, length
+    lengths[i]) by minimizing the one-step squared error over the grid.
+    Returns the final level, final trend and squared error of every series.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    lengths = np.asarray(lengths)
+    n_series, n_steps = values.shape
+    alpha, beta = smoothing_grid(grid_size)
+    shape = (n_series, len(alpha))
+
+    # States are tracked as y-driven part + l0 * (response to l0) + b0 * (response to b0)
+    level = {part: np.zeros(shape) for part in ("y", "l0", "b0")}
+    trend = {part: np.zeros(shape) for part in ("y", "l0", "b0")}
+    level["l0"][:] = 1.0
+    trend["b0"][:] = 1.0
+    # Normal equations of the least squares fit of the initial states
+    s_uu, s_uv, s_vv, s_ur, s_vr, s_rr = (np.zeros(shape) for _ in range(6))
+
+    for t in range(n_steps):
+        active = (t < lengths)[:, None]
+        y = values[:, t][:, None]
+        # Prediction error = r - l0 * u - b0 * v
+        r = y - (level["y"] + trend["y"])
+        u = level["l0"] + trend["l0"]
+        v = level["b0"] + trend["b0"]
+        s_uu += np.where(active, u * u, 0)
+        s_uv += np.where(active, u * v, 0)
+        s_vv += np.where(active, v * v, 0)
+        s_ur += np.where(active, u * r, 0)
+        s_vr += np.where(active, v * r, 0)
+        s_rr += np.where(active, r * r, 0)
+
+        for part in level:
+            driven = y if part == "y" else 0.0
+            new_level = alpha * driven + (1 - alpha) * (level[part] + trend[part])
+            new_trend = beta * (new_level - level[part]) + (1 - beta) * trend[part]
+            level[part] = np.where(active, new_level, level[part])
+            trend[part] = np.where(active, new_trend, trend[part])
+
+    det = s_uu * s_vv - s_uv ** 2
+    solvable = np.abs(det) > 1e-12 * np.maximum(s_uu * s_vv, 1e-300)
+    safe_det = np.where(solvable, det, 1.0)
+    l0 = np.where(solvable, (s_vv * s_ur - s_uv * s_vr) / safe_det, values[:, :1])
+    b0 = np.where(solvable, (s_uu * s_vr - s_uv * s_ur) / safe_det, (values[:, 1:2] - values[:, :1]))
+    sse = s_rr - 2 * l0 * s_ur - 2 * b0 * s_vr + l0 ** 2 * s_uu + 2 * l0 * b0 * s_uv + b0 ** 2 * s_vv
+
+    best = np.argmin(np.where(np.isfinite(sse), sse, np.inf), axis=1)
+    rows = np.arange(n_series)
+    pick = lambda states: (
+        states["y"][rows, best] + l0[rows, best] * states["l0"][rows, best] + b0[rows, best] * states["b0"][rows, best]
+    )
+    return pick(level), pick(trend), sse[rows, best]
+
+
+def forecast_batch(keywords, series_list, periods=6, grid_size=GRID_SIZE, batch_size=BATCH_SIZE,
+                   return_sse=False):
+    """forecast_keyword() for many series at once, fitted with fit_holt()"""
+    results = [
+        {"keyword": keyword, "trend": "no_data", "growth_rate": 0} for keyword in keywords
+    ]
+    errors = [None] * len(keywords)
+    eligible = [i for i, counts in enumerate(series_list) if len(counts) >= MIN_OBSERVATIONS]
+
+    for start in range(0, len(eligible), batch_size):
+        batch = eligible[start : start + batch_size]
+        lengths = np.array([len(series_list[i]) for i in batch])
+        values = np.zeros((len(batch), lengths.max()))
+        for row, i in enumerate(batch):
+            values[row, : lengths[row]] = np.asarray(series_list[i], dtype=np.float64)
+
+        level, trend, sse = fit_holt(values, lengths, grid_size)
+        last_forecast = level + periods * trend
+        for row, i in enumerate(batch):
+            if not np.isfinite(last_forecast[row]):
+                results[i] = {"keyword": keywords[i], "trend": "error", "growth_rate": 0}
+                continue
+            results[i] = classify(keywords[i], values[row, lengths[row] - 1], last_forecast[row])
+            errors[i] = float(sse[row])
+    return (results, errors) if return_sse else results
+
+
+def _fit_statsmodels_args(args):
+    return fit_statsmodels(*args)
+
+
+def forecast_statsmodels(keywords, series_list, periods=6, workers=None, return_sse=False):
+    """The per-keyword statsmodels path, spread over a process pool"""
+    workers = workers or os.cpu_count() or 1
+    tasks = [(keyword, counts, periods) for keyword, counts in zip(keywords, series_list)]
+    if workers <= 1:
+        fits = [fit_statsmodels(*task) for task in tasks]
+    else:
+        with process_pool(workers) as pool:
+            fits = list(pool.map(_fit_statsmodels_args, tasks, chunksize=32))
+    results = [result for result, _ in fits]
+    return (results, [sse for _, sse in fits]) if return_sse else results
+
+
+def parity_check(keywords, series_list, periods=6, workers=None, min_agreement=0.9, max_sse_ratio=1.01):
+    """
+    Compare the batched engine with statsmodels on the same series: trend label
+    agreement, and the ratio of the engine's squared error to statsmodels'.
+    Labels can legitimately differ when the last month is near zero, since the
+    growth rate divides by it, so the fit quality is checked as well.
+    """
+    expected, expected_sse = forecast_statsmodels(keywords, series_list, periods, workers, return_sse=True)
+    actual, actual_sse = forecast_batch(keywords, series_list, periods, return_sse=True)
+
+    fitted = [i for i in range(len(keywords)) if expected_sse[i] is not None and actual_sse[i] is not None]
+    agreement = float(np.mean([expected[i]["trend"] == actual[i]["trend"] for i in fitted])) if fitted else 1.0
+    ratios = np.array([(actual_sse[i] + 1e-9) / (expected_sse[i] + 1e-9) for i in fitted])
+    p99_ratio = float(np.quantile(ratios, 0.99)) if len(ratios) else 1.0
+    return {
+        "series": len(keywords),
+        "fitted": len(fitted),
+        "trend_agreement": round(agreement, 4),
+        "median_sse_ratio": round(float(np.median(ratios)), 6) if len(ratios) else 1.0,
+        "p99_sse_ratio": round(p99_ratio, 6),
+        "passed": agreement >= min_agreement and p99_ratio <= max_sse_ratio,
+    }
+
+
+def synthetic_series(n_series=300, seed=0):
+    """
+    Fixed monthly count series for parity checks without pipeline outputs:
+    rising, falling and flat Poisson counts of varied scale and length,
+    some shorter than MIN_OBSERVATIONS.
+    """
+    rng = np.random.default_rng(seed)
+    keywords, series_list = [], []
+    for i in range(n_series):
+        length = int(rng.integers(MIN_OBSERVATIONS - 2, 37))
+        base = rng.uniform(1, 200)
+        slope = rng.choice([-1, 0, 1]) * rng.uniform(0.02, 0.15) * base
+        mean = np.maximum(base + slope * np.arange(length), 0.5)
+        keywords.append(f"synthetic_{i}")
+        series_list.append(pd.Series(rng.poisson(mean).astype(np.float64)))
+    return keywords, series_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the batched Holt engine against statsmodels")
+    parser.add_argument("command", choices=["parity"])
+    parser.add_argument("--counts", default=COUNTS_FILE, help="keyword x month count cube (.npz)")
+    parser.add_argument("--synthetic", action="store_true", help="check on fixed synthetic series instead of --counts")
+    parser.add_argument("--periods", type=int, default=6)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--min-agreement", type=float, default=0.9)
+    parser.add_argument("--max-sse-ratio", type=float, default=1.01)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        keywords, series_list = synthetic_series()
+    else:
+        cube = KeywordMonthCube.load(args.counts)
+        keywords, series_list = cube.keywords, [cube.series(row) for row in range(len(cube))]
+    result = parity_check(keywords, series_list, args.periods, args.workers,
+                          min_agreement=args.min_agreement, max_sse_ratio=args.max_sse_ratio)
+    print(result)
+
+    failed = []
+    if result["trend_agreement"] < args.min_agreement:
+        failed.append(f"trend agreement {result['trend_agreement']} < {args.min_agreement}")
+    if result["p99_sse_ratio"] > args.max_sse_ratio:
+        failed.append(f"p99 SSE ratio {result['p99_sse_ratio']} > {args.max_sse_ratio}")
+    for failure in failed:
+        print(f"❌ {failure}")
+    if not failed:
+        print("✅ Batched Holt engine matches statsmodels")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,131 @@
 import os
-import re
-import ast
+import sys
 import numpy as np
 import pandas as pd
-import torch
-from transformers import AutoTokenizer, AutoModel
 from tqdm import tqdm
-import umap
-import hdbscan
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import matplotlib.pyplot as plt
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
 import json
+import argparse
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+import joblib
+
+# torch, transformers, UMAP, HDBSCAN and scikit-learn are imported inside the
+# functions that use them, so spawned pool workers (see pools.py) stay light
+
+# Shared embedding backends live next to api.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embedding_backend import OnnxEmbedder
+from embedding_store import EmbeddingStore
+from keyword_index import ann_search, build_ann, normalize_rows
+from count_cube import KeywordMonthCube
+from holt import forecast_batch, forecast_statsmodels
+from pools import process_pool
+from stages import Pipeline, Stage
+from text_normalize import (
+    build_text,
+    clean_texts,
+    clean_texts_batch,
+    join_tags,
+    normalize_pool,
+    safe_join_tags,
+    strip_emails,
+)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
 
 # =============== 0. GLOBAL SETTINGS ===============
 MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-CACHE_FILE = "videos_with_embeddings.pkl"
+# "torch" (default) or "onnx"; EMBEDDING_QUANTIZE=1 selects the int8 ONNX model
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "0") == "1"
+DATA_FILE = "../data/cleaned_videos.csv"
+# Rows per chunk when streaming the CSV into PREPARED_FILE; 0 reads it as one chunk
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "100000"))
+PREPARED_FILE = "prepared.parquet"
+# Inputs to clean_text that later stages never read
+RAW_TEXT_COLUMNS = ["title", "description", "tags", "text"]
+# Per-stage outputs, keyed by a hash of each stage's code, params and inputs
+CHECKPOINT_DIR = "checkpoints"
+EMBEDDING_STORE_DIR = "embedding_store"
+# Row-aligned embedding matrix for the current run, opened memory-mapped by later stages
+EMBEDDINGS_FILE = "embeddings.npy"
+EMBEDDINGS_INDEX_FILE = "embeddings_index.npy"
+# float16 halves disk and page-cache use; stages upcast chunk by chunk
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32")
+# Bump when embed() changes how vectors are computed, so cached vectors are not reused
+EMBEDDING_VERSION = "masked-mean-128"
+# Padded tokens per embedding batch; 0 falls back to fixed 128-row batches
+EMBEDDING_TOKEN_BUDGET = int(os.getenv("EMBEDDING_TOKEN_BUDGET", "16384"))
+# CPU worker processes for new pipeline embeddings (1 = embed in-process) and texts per shard
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))
+EMBEDDING_SHARD_SIZE = int(os.getenv("EMBEDDING_SHARD_SIZE", "2048"))
+# UMAP is fitted once on this many sampled rows; every row is then projected with transform()
+UMAP_SAMPLE_SIZE = int(os.getenv("UMAP_SAMPLE_SIZE", "50000"))
+UMAP_TRANSFORM_WORKERS = int(os.getenv("UMAP_TRANSFORM_WORKERS", str(os.cpu_count() or 1)))
+UMAP_REDUCER_FILE = "umap_reducer.joblib"
+# Keyword dedup: similarity entries per block, and keyword count above which HNSW is used
+DEDUP_BLOCK_ELEMENTS = int(os.getenv("DEDUP_BLOCK_ELEMENTS", str(2**25)))
+DEDUP_ANN_THRESHOLD = int(os.getenv("DEDUP_ANN_THRESHOLD", "50000"))
 FORECAST_HORIZON_MONTHS = 6
-
-def deduplicate_keywords(df_keywords, tokenizer, model, device, threshold=0.9):
+# "numpy" (batched Holt fits) or "statsmodels" (per-keyword fits in a process pool)
+FORECAST_ENGINE = os.getenv("FORECAST_ENGINE", "numpy")
+# (category, keyword) x month mention counts shared by forecasting, the API and notebooks
+KEYWORD_MONTH_COUNTS_FILE = "../outputs/keyword_month_counts.npz"
+
+def similar_pairs_blockwise(embeddings, threshold, block_elements=None):
+    """(row, col) pairs with cosine similarity >= threshold, one block of rows at a time"""
+    block_elements = block_elements or DEDUP_BLOCK_ELEMENTS
+    block_size = max(1, block_elements // max(len(embeddings), 1))
+    rows, cols = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    for start in range(0, len(embeddings), block_size):
+        sims = embeddings[start : start + block_size] @ embeddings.T
+        block_rows, block_cols = np.nonzero(sims >= threshold)
+        rows.append(block_rows + start)
+        cols.append(block_cols)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def similar_pairs_ann(embeddings, threshold, k=32):
     """
-    Remove near-duplicate keywords using embeddings + cosine similarity.
+    (row, col) pairs with cosine similarity >= threshold from an HNSW index.
+    Rows whose k-th neighbour is still above the threshold are queried again
+    with a larger k, so dense groups of duplicates are not cut off.
     """
-    import numpy as np
-    from sklearn.metrics.pairwise import cosine_similarity
+    n = len(embeddings)
+    index = build_ann(embeddings)
+
+    rows, cols = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+    pending = np.arange(n)
+    while len(pending):
+        k = min(k, n)
+        labels, similarities = ann_search(index, embeddings[pending], k, ef=max(64, k * 2))
+        hits = similarities >= threshold
+        hit_rows, hit_cols = np.nonzero(hits)
+        rows.append(pending[hit_rows])
+        cols.append(labels[hit_rows, hit_cols])
+        if k == n:
+            break
+        pending = pending[hits[:, -1]]
+        k *= 2
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def deduplicate_keywords(df_keywords, tokenizer, model, device, threshold=0.9, transitive=False):
+    """
+    Remove near-duplicate keywords using embeddings + cosine similarity.
 
+    Keywords are visited in first-seen order; each one not already marked as a
+    duplicate is kept and marks every keyword within threshold of it. Only the
+    sparse graph of pairs above the threshold is ever held in memory: it comes
+    from blockwise similarity, or an HNSW index above DEDUP_ANN_THRESHOLD
+    keywords. transitive=True instead merges connected groups with union-find
+    and keeps the first-seen keyword of each group.
+    """
     # Normalize keywords
     df_keywords["normalized_kw"] = (
         df_keywords["keywords"]
@@ -36,21 +136,34 @@ def deduplicate_keywords(df_keywords, tokenizer, model, device, threshold=0.9):
     )
 
     unique_keywords = df_keywords["normalized_kw"].unique().tolist()
-    embeddings = embed(unique_keywords, tokenizer, model, device).numpy()
+    embeddings = normalize_rows(embed(unique_keywords, tokenizer, model, device).numpy())
 
-    sims = cosine_similarity(embeddings)
-
-    keep = set()
-    seen = set()
-    for i, kw in enumerate(unique_keywords):
-        if kw in seen:
-            continue
-        keep.add(kw)
-        dupes = np.where(sims[i] >= threshold)[0]
-        for j in dupes:
-            seen.add(unique_keywords[j])
+    n = len(unique_keywords)
+    if hnswlib is not None and n > DEDUP_ANN_THRESHOLD:
+        rows, cols = similar_pairs_ann(embeddings, threshold)
+    else:
+        rows, cols = similar_pairs_blockwise(embeddings, threshold)
+    # Similarity is symmetric, but approximate neighbour lists need not be
+    graph = sparse.csr_matrix(
+        (np.ones(2 * len(rows), dtype=bool), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+        shape=(n, n),
+    )
 
-    df_keywords = df_keywords[df_keywords["normalized_kw"].isin(keep)].copy()
+    keep = np.zeros(n, dtype=bool)
+    if transitive:
+        _, groups = connected_components(graph, directed=False)
+        _, first = np.unique(groups, return_index=True)
+        keep[first] = True
+    else:
+        seen = np.zeros(n, dtype=bool)
+        for i in range(n):
+            if seen[i]:
+                continue
+            keep[i] = True
+            seen[graph.indices[graph.indptr[i] : graph.indptr[i + 1]]] = True
+
+    kept_keywords = {kw for kw, kept in zip(unique_keywords, keep) if kept}
+    df_keywords = df_keywords[df_keywords["normalized_kw"].isin(kept_keywords)].copy()
     return df_keywords.drop(columns=["normalized_kw"])
 
 
@@ -63,102 +176,372 @@ def load_data(path: str) -> pd.DataFrame:
     return df
 
 
-def safe_join_tags(x):
-    if isinstance(x, str):
-        try:
-            return " ".join(ast.literal_eval(x))
-        except Exception:
-            return x
-    return ""
+def prepare_text(df: pd.DataFrame, pool=None) -> pd.DataFrame:
+    df["text"] = build_text(df)
+    df["clean_text"] = clean_texts(df["text"], pool=pool)
+    return df
 
 
-def clean_text(text: str) -> str:
-    text = text.lower()
-    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
-    text = re.sub(r"\S+@\S+", "", text)
-    text = re.sub(r"[^a-z0-9#\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
+def parquet_safe(chunk):
+    """Give every chunk the same column types, so all chunks fit one Parquet schema"""
+    for column in chunk.columns:
+        values = chunk[column]
+        if column in ("videoId", "publishedAt") or pd.api.types.is_bool_dtype(values):
+            continue
+        if pd.api.types.is_numeric_dtype(values):
+            chunk[column] = values.astype("float64")
+        else:
+            chunk[column] = values.astype("string")
+    return chunk
 
 
-def prepare_text(df: pd.DataFrame) -> pd.DataFrame:
-    df["text"] = (
-        df["title"].fillna("")
-        + " "
-        + df["description"].fillna("")
-        + " "
-        + df["tags"].apply(safe_join_tags)
-    )
-    df["clean_text"] = df["text"].apply(clean_text)
-    return df
+def ingest_csv(path, output_path, chunk_size, on_chunk=None):
+    """
+    Read the CSV chunk by chunk, build clean_text for each chunk and append it to
+    a Parquet file without the raw text columns, so only one chunk of raw text
+    is in memory at a time. chunk_size <= 0 reads the whole file as one chunk,
+    normalized the same way. on_chunk(chunk) sees each normalized chunk first.
+    One pool of text-cleaning processes serves every chunk.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tmp_path = f"{output_path}.tmp"
+    writer = None
+    rows = 0
+    pool = normalize_pool()
+    try:
+        text_types = {column: str for column in ("title", "description", "tags")}
+        if chunk_size > 0:
+            chunks = pd.read_csv(path, chunksize=chunk_size, dtype=text_types)
+        else:
+            chunks = [pd.read_csv(path, dtype=text_types)]
+        for chunk in chunks:
+            if "videoId" not in chunk.columns:
+                chunk.insert(0, "videoId", np.arange(rows, rows + len(chunk)))
+            rows += len(chunk)
+            # utc=True keeps the column type stable even for chunks without a valid date
+            chunk["publishedAt"] = pd.to_datetime(chunk["publishedAt"], errors="coerce", utc=True)
+            chunk = parquet_safe(prepare_text(chunk, pool).drop(columns=RAW_TEXT_COLUMNS, errors="ignore"))
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            print(f"📥 Ingested {rows} rows")
+    finally:
+        if writer is not None:
+            writer.close()
+        if pool is not None:
+            pool.shutdown()
+
+    if writer is None:
+        raise ValueError(f"No rows in {path}")
+    os.replace(tmp_path, output_path)
 
 
 # =============== 2. EMBEDDINGS ===============
-def load_model():
+def load_model(device=None):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
     tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+
+    if EMBEDDING_BACKEND == "onnx":
+        # ONNX Runtime on CPU stands in for the torch model's forward call in embed()
+        model = OnnxEmbedder(MODEL_NAME, quantize=EMBEDDING_QUANTIZE)
+        return tokenizer, model, torch.device("cpu")
+
     model = AutoModel.from_pretrained(MODEL_NAME)
 
-    if torch.backends.mps.is_available():
-        device = torch.device("mps")
-    elif torch.cuda.is_available():
-        device = torch.device("cuda")
-    else:
-        device = torch.device("cpu")
+    if device is None:
+        if torch.backends.mps.is_available():
+            device = torch.device("mps")
+        elif torch.cuda.is_available():
+            device = torch.device("cuda")
+        else:
+            device = torch.device("cpu")
 
     return tokenizer, model.to(device), device
 
 
-def embed(texts, tokenizer, model, device, batch_size=128, max_length=128):
+def token_budget_batches(lengths, token_budget):
+    """
+    Group row indices, shortest first, so each batch's padded size
+    (rows x longest row) stays within token_budget.
+    """
+    batches, batch, longest = [], [], 0
+    for idx in np.argsort(lengths, kind="stable"):
+        length = max(int(lengths[idx]), 1)
+        if batch and max(longest, length) * (len(batch) + 1) > token_budget:
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(idx)
+        longest = max(longest, length)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def embed(texts, tokenizer, model, device, batch_size=128, max_length=128, token_budget=None):
+    """
+    Mean-pooled embeddings over non-padding tokens, returned in input order.
+
+    With a token budget, texts are tokenized once, sorted by length and packed
+    into batches of at most token_budget padded tokens, so short titles are not
+    padded out to the longest description. token_budget=0 keeps fixed batches
+    of batch_size rows in input order.
+    """
+    encoded = tokenizer(list(texts), truncation=True, max_length=max_length)
+    return embed_encoded(encoded, tokenizer, model, device, batch_size, token_budget)
+
+
+def embed_encoded(encoded, tokenizer, model, device, batch_size=128, token_budget=None, progress=True):
+    """Pad, run and pool already tokenized (unpadded) texts; see embed()"""
+    import torch
+
+    if token_budget is None:
+        token_budget = EMBEDDING_TOKEN_BUDGET
+    num_texts = len(encoded["input_ids"])
+    if token_budget > 0:
+        lengths = np.array([len(ids) for ids in encoded["input_ids"]])
+        batches = token_budget_batches(lengths, token_budget)
+    else:
+        batches = [list(range(i, min(i + batch_size, num_texts))) for i in range(0, num_texts, batch_size)]
+
     all_embeddings = []
-    for i in tqdm(range(0, len(texts), batch_size), desc="Embedding batches"):
-        batch = texts[i : i + batch_size]
-        encoded = tokenizer(
-            batch,
-            padding=True,
-            truncation=True,
-            max_length=max_length,
-            return_tensors="pt",
-        ).to(device)
+    for batch in tqdm(batches, desc="Embedding batches", disable=not progress):
+        features = {name: [values[i] for i in batch] for name, values in encoded.items()}
+        padded = tokenizer.pad(features, padding=True, return_tensors="pt").to(device)
         with torch.no_grad():
-            model_output = model(**encoded)
-        batch_embeddings = model_output.last_hidden_state.mean(dim=1)
+            model_output = model(**padded)
+        mask = padded["attention_mask"].unsqueeze(-1).to(model_output.last_hidden_state.dtype)
+        summed = (model_output.last_hidden_state * mask).sum(dim=1)
+        batch_embeddings = summed / mask.sum(dim=1).clamp(min=1e-9)
         all_embeddings.append(batch_embeddings.cpu())
-    return torch.cat(all_embeddings)
 
+    # Scatter the length-sorted rows back to input order
+    order = torch.as_tensor(np.concatenate(batches), dtype=torch.long)
+    stacked = torch.cat(all_embeddings)
+    result = torch.empty_like(stacked)
+    result[order] = stacked
+    return result
+
+
+# Per-process model for embed_parallel() workers, loaded once by init_embedding_worker()
+_worker_model = None
+
+
+def init_embedding_worker(num_threads):
+    global _worker_model
+    import torch
+
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    os.environ["ORT_NUM_THREADS"] = str(num_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _worker_model = load_model(device=torch.device("cpu"))
+
+
+def embed_shard(encoded):
+    tokenizer, model, device = _worker_model
+    return embed_encoded(encoded, tokenizer, model, device, progress=False).numpy()
 
-def get_embeddings(df, tokenizer, model, device) -> pd.DataFrame:
-    if os.path.exists(CACHE_FILE):
-        print("⚡ Loading cached embeddings...")
-        df = pd.read_pickle(CACHE_FILE)
+
+def embedding_pool(workers):
+    """
+    Worker processes for embed_parallel(), each loading its own model with a
+    pinned share of the cores. Workers start on first use, so a pool created
+    for a run whose texts are all cached costs nothing.
+    """
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"🧵 Embedding with {workers} workers x {num_threads} threads...")
+    return process_pool(workers, initializer=init_embedding_worker, initargs=(num_threads,))
+
+
+def embed_parallel(texts, tokenizer, pool, shard_size=None, max_length=128):
+    """
+    CPU embedding across an embedding_pool(). The parent tokenizes shard by
+    shard while the workers run inference on earlier shards; results come
+    back in input order.
+    """
+    import torch
+
+    shard_size = shard_size or EMBEDDING_SHARD_SIZE
+    futures = []
+    for start in range(0, len(texts), shard_size):
+        encoded = tokenizer(list(texts[start : start + shard_size]), truncation=True, max_length=max_length)
+        futures.append(pool.submit(embed_shard, dict(encoded)))
+    shards = [future.result() for future in tqdm(futures, desc="Embedding shards")]
+    return torch.from_numpy(np.concatenate(shards))
+
+
+def embedding_model_key(model):
+    """Everything that changes the vectors: model, revision, backend and embed() version"""
+    if isinstance(model, OnnxEmbedder):
+        backend = "onnx-int8" if model.quantize else "onnx"
+        revision = "exported"
     else:
-        print("🚀 Generating embeddings...")
-        embeddings = embed(df["clean_text"].tolist(), tokenizer, model, device)
-        df["embedding"] = embeddings.tolist()
-        df.to_pickle(CACHE_FILE)
+        backend = "torch"
+        revision = getattr(model.config, "_commit_hash", None) or "local"
+    return f"{MODEL_NAME}@{revision}|{backend}|{EMBEDDING_VERSION}"
+
+
+def write_embedding_matrix(store, positions, row_ids, chunk_size=65536):
+    """Write the store rows for this run, in DataFrame order, to a contiguous .npy file"""
+    tmp_path = f"{EMBEDDINGS_FILE}.tmp"
+    matrix = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=EMBEDDING_DTYPE, shape=(len(positions), store.dim)
+    )
+    for start in range(0, len(positions), chunk_size):
+        matrix[start : start + chunk_size] = store.get(positions[start : start + chunk_size])
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, EMBEDDINGS_FILE)
+    np.save(EMBEDDINGS_INDEX_FILE, np.asarray(row_ids).astype(str))
+
+
+def load_embeddings():
+    """Open the run's embedding matrix read-only and memory-mapped, without loading it"""
+    return np.load(EMBEDDINGS_FILE, mmap_mode="r")
+
+
+def embed_missing(store, texts, tokenizer, model, device, pool=None):
+    """
+    Embed the texts the store has not seen yet; returns every text's row in the
+    store. pool is an embedding_pool() to reuse across calls; without one, a
+    pool is started for this call when EMBEDDING_WORKERS asks for one.
+    """
+    keys = store.keys_for(texts)
+    positions = store.lookup(keys)
+
+    missing = np.flatnonzero(positions < 0)
+    if len(missing):
+        new_keys, first = np.unique(keys[missing], return_index=True)
+        new_texts = [texts[i] for i in missing[first]]
+        print(f"🚀 Embedding {len(new_texts)} new texts ({len(texts) - len(missing)} rows cached)...")
+        if EMBEDDING_WORKERS > 1 and device.type == "cpu" and len(new_texts) > EMBEDDING_SHARD_SIZE:
+            if pool is not None:
+                embeddings = embed_parallel(new_texts, tokenizer, pool)
+            else:
+                with embedding_pool(EMBEDDING_WORKERS) as pool:
+                    embeddings = embed_parallel(new_texts, tokenizer, pool)
+        else:
+            embeddings = embed(new_texts, tokenizer, model, device)
+        store.add(new_keys, embeddings.numpy())
+        positions = store.lookup(keys)
         print("✅ Embeddings saved!")
-    return df
+    return positions
+
+
+def get_embeddings(df, tokenizer, model, device):
+    """
+    Embed only texts not seen before, reusing cached vectors for everything else.
+    Returns the DataFrame and a memory-mapped (rows x dim) array aligned with it.
+    """
+    store = EmbeddingStore(EMBEDDING_STORE_DIR, embedding_model_key(model))
+    positions = embed_missing(store, df["clean_text"].tolist(), tokenizer, model, device)
+    write_embedding_matrix(store, positions, df["videoId"])
+    return df, load_embeddings()
 
 
 # =============== 3. CLUSTERING & KEYWORDS ===============
+# Per-process reducer for parallel UMAP transforms, loaded once by init_umap_worker()
+_worker_reducer = None
+
+
+def init_umap_worker(path):
+    global _worker_reducer
+    _worker_reducer = joblib.load(path)["reducer"]
+
+
+def umap_transform_chunk(chunk):
+    return _worker_reducer.transform(chunk)
+
+
+def umap_sample(n_rows, sample_size):
+    """Row indices UMAP is fitted on: a fixed-seed random sample, in row order"""
+    rng = np.random.default_rng(42)
+    return np.sort(rng.choice(n_rows, size=min(sample_size, n_rows), replace=False))
+
+
+def fit_umap_reducer(embeddings, params, reducer_key, sample_size):
+    """
+    Fit one UMAP reducer on a random sample of rows and persist it, or reuse the
+    saved reducer when the settings and the sampled vectors are unchanged.
+    """
+    import umap
+
+    sample = umap_sample(len(embeddings), sample_size)
+    fitted = np.ascontiguousarray(embeddings[sample], dtype=np.float32)
+    # Fingerprint of the rows the reducer is fitted on, so new data refits it
+    digest = hashlib.sha1(f"{len(embeddings)}:{fitted.shape}".encode("utf-8"))
+    digest.update(sample.tobytes())
+    digest.update(fitted.tobytes())
+    key = {"reducer_key": reducer_key, "sample_size": sample_size, "data": digest.hexdigest(), **params}
+    if os.path.exists(UMAP_REDUCER_FILE):
+        saved = joblib.load(UMAP_REDUCER_FILE)
+        if saved.get("key") == key:
+            print("⚡ Reusing fitted UMAP reducer")
+            return saved["reducer"]
+
+    print(f"Fitting UMAP on {len(sample)} of {len(embeddings)} embeddings ...")
+    reducer = umap.UMAP(**params, random_state=42)
+    reducer.fit(fitted)
+
+    tmp_path = f"{UMAP_REDUCER_FILE}.tmp"
+    joblib.dump({"key": key, "reducer": reducer}, tmp_path)
+    os.replace(tmp_path, UMAP_REDUCER_FILE)
+    return reducer
+
+
 def cluster_embeddings(
-    df, n_neighbors=15, n_components=50, min_cluster_size=5, chunk_size=5000
+    df,
+    embeddings,
+    n_neighbors=15,
+    n_components=50,
+    min_cluster_size=5,
+    chunk_size=5000,
+    reducer_key=None,
+    sample_size=None,
+    workers=None,
 ):
-    embeddings_array = np.array(df["embedding"].tolist())
-    all_umap_embeddings = []
-
-    for start in range(0, len(embeddings_array), chunk_size):
-        end = min(start + chunk_size, len(embeddings_array))
-        print(f"Processing embeddings {start} to {end} ...")
-        reducer = umap.UMAP(
-            n_neighbors=n_neighbors,
-            n_components=n_components,
-            metric="euclidean",
-            random_state=42,
-        )
-        chunk_umap = reducer.fit_transform(embeddings_array[start:end])
-        all_umap_embeddings.append(chunk_umap)
+    """
+    Reduce every row with a single UMAP reducer fitted on a sample, so all rows
+    share one coordinate space, then cluster the result with HDBSCAN.
+    Every row, sampled or not, is projected with transform() in chunks across
+    worker processes, so a fresh fit and a reused reducer give the same result.
+    """
+    import hdbscan
+
+    sample_size = sample_size or UMAP_SAMPLE_SIZE
+    workers = workers or UMAP_TRANSFORM_WORKERS
+    params = {"n_neighbors": n_neighbors, "n_components": n_components, "metric": "euclidean"}
+    reducer = fit_umap_reducer(embeddings, params, reducer_key, sample_size)
+
+    embeddings_umap_full = np.empty((len(embeddings), n_components), dtype=np.float32)
+    positions = np.arange(len(embeddings))
+    chunks = [positions[i : i + chunk_size] for i in range(0, len(positions), chunk_size)]
+    if chunks:
+        print(f"Projecting {len(positions)} embeddings in {len(chunks)} chunks ...")
+    if workers > 1 and len(chunks) > 1:
+        with process_pool(workers, initializer=init_umap_worker, initargs=(UMAP_REDUCER_FILE,)) as pool:
+            # Keep a bounded number of chunks in flight so memory stays flat
+            pending = {}
+            for rows in tqdm(chunks, desc="UMAP transform"):
+                pending[pool.submit(umap_transform_chunk, np.asarray(embeddings[rows], dtype=np.float32))] = rows
+                if len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        embeddings_umap_full[pending.pop(future)] = future.result()
+            for future in as_completed(pending):
+                embeddings_umap_full[pending[future]] = future.result()
+    else:
+        for rows in tqdm(chunks, desc="UMAP transform"):
+            embeddings_umap_full[rows] = reducer.transform(np.asarray(embeddings[rows], dtype=np.float32))
 
-    embeddings_umap_full = np.vstack(all_umap_embeddings)
     print("UMAP reduction done:", embeddings_umap_full.shape)
 
     clusterer = hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, metric="euclidean")
@@ -167,17 +550,55 @@ def cluster_embeddings(
     return df
 
 
-def extract_keywords(df):
-    cluster_keywords = {}
-    for cluster_id in sorted(df["cluster"].unique()):
-        cluster_texts = df[df["cluster"] == cluster_id]["clean_text"]
-        if len(cluster_texts) == 0:
-            continue
-        vectorizer = TfidfVectorizer(
-            stop_words="english", max_features=10, ngram_range=(1, 3)
-        )
-        vectorizer.fit(cluster_texts)
-        cluster_keywords[cluster_id] = vectorizer.get_feature_names_out().tolist()
+def top_terms_per_row(scores, k):
+    """Column indices of the k highest-scoring entries in each row of a CSR matrix, ties to the lower index"""
+    scores = scores.tocsr()
+    scores.sum_duplicates()
+    rows = np.repeat(np.arange(scores.shape[0]), np.diff(scores.indptr))
+    order = np.lexsort((scores.indices, -scores.data, rows))
+    rank = np.arange(len(order)) - scores.indptr[rows[order]]
+    keep = order[rank < k]
+    # Report each row's terms in vocabulary (alphabetical) order
+    keep = keep[np.lexsort((scores.indices[keep], rows[keep]))]
+    return rows[keep], scores.indices[keep]
+
+
+def extract_keywords(df, top_k=10, scoring="frequency"):
+    """
+    Top terms per cluster from one vectorization of the whole corpus.
+
+    Document term counts are summed per cluster with a sparse cluster-indicator
+    product. scoring="frequency" keeps the most frequent terms in each cluster,
+    as TfidfVectorizer(max_features=10) fitted per cluster did; "ctfidf" ranks
+    them by class-based TF-IDF instead.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    vectorizer = CountVectorizer(stop_words="english", ngram_range=(1, 3), dtype=np.int64)
+    doc_terms = vectorizer.fit_transform(df["clean_text"])
+    terms = vectorizer.get_feature_names_out()
+
+    cluster_ids, codes = np.unique(df["cluster"].to_numpy(), return_inverse=True)
+    indicator = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int64), (codes, np.arange(len(codes)))),
+        shape=(len(cluster_ids), len(codes)),
+    )
+    cluster_terms = (indicator @ doc_terms).tocsr()
+
+    if scoring == "ctfidf":
+        # tf(term, cluster) / words(cluster) * log(1 + mean words per cluster / term frequency)
+        words_per_cluster = np.asarray(cluster_terms.sum(axis=1)).ravel()
+        term_frequency = np.asarray(cluster_terms.sum(axis=0)).ravel()
+        idf = np.log1p(words_per_cluster.mean() / np.maximum(term_frequency, 1))
+        tf = sparse.diags(1 / np.maximum(words_per_cluster, 1)) @ cluster_terms
+        cluster_terms = (tf @ sparse.diags(idf)).tocsr()
+    elif scoring != "frequency":
+        raise ValueError(f"Unknown keyword scoring: {scoring}")
+
+    rows, columns = top_terms_per_row(cluster_terms, top_k)
+    cluster_keywords = {cluster_id: [] for cluster_id in cluster_ids}
+    for row, column in zip(rows, columns):
+        cluster_keywords[cluster_ids[row]].append(terms[column])
 
     df["keywords"] = df["cluster"].map(cluster_keywords)
     df_keywords = df.explode("keywords").reset_index(drop=True)
@@ -186,6 +607,8 @@ def extract_keywords(df):
 
 # =============== 4. CATEGORY MAPPING ===============
 def map_keywords_to_categories(df_keywords, tokenizer, model, device, base_confidence=0.5):
+    from sklearn.metrics.pairwise import cosine_similarity
+
     categories = [
         "Makeup & Cosmetics",
         "Hair Transformations & Makeovers",
@@ -255,56 +678,35 @@ def category_summary(df_keywords):
 
 
 # =============== 6. FORECASTING ===============
-def forecast_keyword(keyword, df, periods=6):
-    """Forecast trend for a single keyword."""
-    df_kw = df[df["keywords"] == keyword].copy()
-    if df_kw.empty:
-        return {"keyword": keyword, "trend": "no_data", "growth_rate": 0}
-
-    df_kw["publishedAt"] = pd.to_datetime(df_kw["publishedAt"], errors="coerce")
-    df_kw = (
-        df_kw.set_index("publishedAt")
-        .resample("M")
-        .size()
-        .reset_index(name="count")
-    )
-    if len(df_kw) < 6:
-        return {"keyword": keyword, "trend": "no_data", "growth_rate": 0}
-
-    try:
-        model = ExponentialSmoothing(df_kw["count"], trend="add", seasonal=None)
-        fit = model.fit()
-        forecast = fit.forecast(periods)
-    except Exception as e:
-        print(f"⚠️ Forecast failed for {keyword}: {e}")
-        return {"keyword": keyword, "trend": "error", "growth_rate": 0}
-
-    last_actual = df_kw["count"].iloc[-1]
-    last_forecast = forecast.iloc[-1]
-    growth_rate = (last_forecast - last_actual) / (last_actual + 1e-6)
-
-    if growth_rate > 0.1:
-        trend = "up"
-    elif growth_rate < -0.1:
-        trend = "down"
-    else:
-        trend = "stable"
+def build_keyword_month_cube(df_keywords, path=KEYWORD_MONTH_COUNTS_FILE):
+    """Count every category's keyword mentions by month in one pass and persist the result"""
+    cube = KeywordMonthCube.build(df_keywords)
+    cube.save(path)
+    print(f"✅ {os.path.basename(path)} saved! ({len(cube)} keywords x {len(cube.months)} months)")
+    return cube
 
-    return {"keyword": keyword, "trend": trend, "growth_rate": float(growth_rate)}
 
-
-def forecast_keywords_by_category(df_keywords, periods=6, top_n=10):
-    """Forecast trending keywords grouped by category."""
+def forecast_keywords_by_category(df_keywords, periods=6, top_n=10, cube=None, engine=None):
+    """
+    Forecast trending keywords grouped by category. The "numpy" engine fits
+    every keyword series in one batch; "statsmodels" fits them one by one
+    across a process pool.
+    """
+    if cube is None:
+        cube = KeywordMonthCube.build(df_keywords)
+    engine = engine or FORECAST_ENGINE
+    keywords = cube.keywords
+    series_list = [cube.series(row) for row in range(len(cube))]
+    if engine == "numpy":
+        forecasts = forecast_batch(keywords, series_list, periods=periods)
+    elif engine == "statsmodels":
+        forecasts = forecast_statsmodels(keywords, series_list, periods=periods)
+    else:
+        raise ValueError(f"Unknown forecast engine: {engine}")
     results = []
 
     for category in df_keywords["category"].unique():
-        df_cat = df_keywords[df_keywords["category"] == category]
-        keywords = df_cat["keywords"].unique().tolist()
-
-        keyword_trends = []
-        for kw in keywords:
-            kw_result = forecast_keyword(kw, df_cat, periods=periods)
-            keyword_trends.append(kw_result)
+        keyword_trends = [forecasts[row] for row in cube.rows_for(category)]
 
         # sort by growth_rate, keep only top_n
         keyword_trends = sorted(keyword_trends, key=lambda x: x["growth_rate"], reverse=True)[:top_n]
@@ -318,40 +720,131 @@ def forecast_keywords_by_category(df_keywords, periods=6, top_n=10):
 
 
 # =============== MAIN PIPELINE ===============
-def main():
-    # 1. Load & prepare data
-    df = load_data("../data/cleaned_videos.csv")
-    df["publishedAt"] = pd.to_datetime(df["publishedAt"], errors="coerce")
-    df = prepare_text(df)
+class PipelineContext:
+    """Model shared by the stages that embed text, loaded only when one of them runs"""
+
+    def __init__(self):
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = load_model()
+        return self._model
+
+
+def embedding_settings_key():
+    """Embedding settings that change the vectors, known without loading the model"""
+    backend = "onnx-int8" if EMBEDDING_BACKEND == "onnx" and EMBEDDING_QUANTIZE else EMBEDDING_BACKEND
+    return f"{MODEL_NAME}|{backend}|{EMBEDDING_VERSION}"
+
+
+def run_load(context, path, chunk_size):
+    """
+    Write the prepared corpus (clean_text, no raw text columns) to PREPARED_FILE
+    and return its path; the pipeline moves it into the load checkpoint. Only
+    ingestion is bounded by chunk_size: later stages embed, cluster and explode
+    all rows at once, so they read the whole prepared corpus into memory.
+    """
+    # Every normalized chunk is embedded into the store as it is read, so the
+    # embed stage afterwards only assembles the matrix. One embedding pool
+    # serves every chunk, so worker models load once per run
+    tokenizer, model, device = context.model
+    store = EmbeddingStore(EMBEDDING_STORE_DIR, embedding_model_key(model))
+    pool = embedding_pool(EMBEDDING_WORKERS) if EMBEDDING_WORKERS > 1 and device.type == "cpu" else None
+    try:
+        ingest_csv(
+            path,
+            PREPARED_FILE,
+            chunk_size,
+            on_chunk=lambda chunk: embed_missing(store, chunk["clean_text"].tolist(), tokenizer, model, device, pool),
+        )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return PREPARED_FILE
+
+
+def run_embed(context, df, settings, dtype):
+    # settings and dtype only key the checkpoint; get_embeddings() reads the globals.
+    # It writes the matrix to EMBEDDINGS_FILE, which the pipeline moves into the checkpoint
+    tokenizer, model, device = context.model
+    get_embeddings(df, tokenizer, model, device)
+    return EMBEDDINGS_FILE
 
-    # 2. Load model
-    tokenizer, model, device = load_model()
 
-    # 3. Generate embeddings
-    df = get_embeddings(df, tokenizer, model, device)
+def run_cluster(context, df, embeddings, **params):
+    return cluster_embeddings(df.copy(), embeddings, reducer_key=embedding_settings_key(), **params)
 
-    # 4. Cluster & extract keywords
-    df = cluster_embeddings(df)
-    df_keywords = extract_keywords(df)
 
-    # 5. Map categories & deduplicate keywords
-    df_keywords = map_keywords_to_categories(df_keywords, tokenizer, model, device)
-    df_keywords = deduplicate_keywords(df_keywords, tokenizer, model, device)
+def run_keywords(context, df, **params):
+    return extract_keywords(df.copy(), **params)
 
-    # 6. Reporting
+
+def run_categories(context, df_keywords, embedding):
+    return map_keywords_to_categories(df_keywords.copy(), *context.model)
+
+
+def run_dedup(context, df_keywords, embedding, **params):
+    return deduplicate_keywords(df_keywords.copy(), *context.model, **params)
+
+
+def run_summary(context, df_keywords):
     summary = category_summary(df_keywords)
     print(summary.head())
+    return summary.reset_index()
+
+
+def run_cube(context, df_keywords):
+    return build_keyword_month_cube(df_keywords)
 
-    # 7. Forecast keyword trends
-    keyword_trend_insights = forecast_keywords_by_category(
-        df_keywords, periods=FORECAST_HORIZON_MONTHS, top_n=10
-    )
 
-    # 8. Save keyword trends
+def run_forecast(context, df_keywords, cube, **params):
+    keyword_trend_insights = forecast_keywords_by_category(df_keywords, cube=cube, **params)
     with open("../outputs/keyword_trend_insights.json", "w") as f:
         json.dump(keyword_trend_insights, f, indent=2)
-
     print("✅ keyword_trend_insights.json saved!")
+    return keyword_trend_insights
+
+
+def build_pipeline(data_path=DATA_FILE):
+    return Pipeline(
+        [
+            Stage("load", run_load, params={"path": data_path, "chunk_size": INGEST_CHUNK_SIZE}, fmt="parquet_file",
+                  files=[data_path], code=[prepare_text, build_text, join_tags, safe_join_tags,
+                        clean_texts, clean_texts_batch, normalize_pool, strip_emails, ingest_csv]),
+            Stage("embed", run_embed, inputs=["load"], fmt="npy_file",
+                  params={"settings": embedding_settings_key(), "dtype": EMBEDDING_DTYPE}),
+            Stage("cluster", run_cluster, inputs=["load", "embed"], code=[cluster_embeddings, fit_umap_reducer, umap_sample],
+                  params={"n_neighbors": 15, "n_components": 50, "min_cluster_size": 5,
+                          "sample_size": UMAP_SAMPLE_SIZE}),
+            Stage("keywords", run_keywords, inputs=["cluster"], code=[extract_keywords, top_terms_per_row],
+                  params={"top_k": 10, "scoring": "frequency"}),
+            Stage("categories", run_categories, inputs=["keywords"], code=[map_keywords_to_categories],
+                  params={"embedding": embedding_settings_key()}),
+            Stage("dedup", run_dedup, inputs=["categories"], code=[deduplicate_keywords],
+                  params={"embedding": embedding_settings_key(), "threshold": 0.9}),
+            Stage("summary", run_summary, inputs=["dedup"], code=[category_summary]),
+            Stage("cube", run_cube, inputs=["dedup"], fmt="cube", code=[KeywordMonthCube]),
+            Stage("forecast", run_forecast, inputs=["dedup", "cube"], fmt="json",
+                  code=[forecast_keywords_by_category],
+                  params={"periods": FORECAST_HORIZON_MONTHS, "top_n": 10, "engine": FORECAST_ENGINE}),
+        ],
+        checkpoint_dir=CHECKPOINT_DIR,
+        context=PipelineContext(),
+    )
+
+
+def main():
+    pipeline = build_pipeline()
+    parser = argparse.ArgumentParser(description="Beauty Scope keyword trend pipeline")
+    parser.add_argument("--stage", choices=pipeline.order, help="re-run only this stage on upstream checkpoints")
+    parser.add_argument("--from-stage", choices=pipeline.order, help="re-run this stage and everything after it")
+    parser.add_argument("--force", action="store_true", help="ignore all checkpoints")
+    args = parser.parse_args()
+
+    pipeline.run(stage=args.stage, from_stage=args.from_stage, force_all=args.force)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,22 @@
+"""
+Process pools for the pipeline's parallel steps.
+
+Every pool starts its workers with spawn rather than fork. The pipeline runs
+torch and the tokenizers' thread pools in the parent process, and a forked
+child inherits those thread pools in whatever state they were in, so it can
+hang on its first call into them; a spawned child starts a fresh interpreter.
+Spawned children re-run the top level of the parent's __main__ module, so
+main.py imports its heavy dependencies inside the functions that use them.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def process_pool(workers, initializer=None, initargs=()):
+    """A ProcessPoolExecutor whose workers are spawned, not forked"""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=initializer,
+        initargs=initargs,
+    )
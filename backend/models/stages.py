@@ -0,0 +1,139 @@
+import hashlib
+import inspect
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from count_cube import KeywordMonthCube
+
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_json(value, path):
+    with open(path, "w") as f:
+        json.dump(value, f, indent=2)
+
+
+def _load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+# Checkpoint formats: file extension, save(value, path), load(path)
+FORMATS = {
+    "parquet": (".parquet", lambda df, path: df.to_parquet(path, index=False), pd.read_parquet),
+    "npy": (".npy", lambda array, path: np.save(path, array), lambda path: np.load(path, mmap_mode="r")),
+    # run returns the path of a file it wrote, moved into place rather than rewritten
+    "parquet_file": (".parquet", os.replace, pd.read_parquet),
+    "npy_file": (".npy", os.replace, lambda path: np.load(path, mmap_mode="r")),
+    "json": (".json", _save_json, _load_json),
+    "cube": (".npz", lambda cube, path: cube.save(path), KeywordMonthCube.load),
+}
+FILE_FORMATS = {"parquet_file", "npy_file"}
+
+
+class Stage:
+    """
+    A named pipeline step. run(context, *upstream outputs, **params) returns
+    the stage output, which is checkpointed in the given format under a key
+    hashed from the source of run and of the functions listed in code, the
+    params, the contents of its input files and its upstream stages' keys.
+    """
+
+    def __init__(self, name, run, inputs=(), params=None, files=(), code=(), fmt="parquet"):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.files = list(files)
+        self.code = [run, *code]
+        self.fmt = fmt
+
+    def key(self, upstream_keys):
+        digest = hashlib.sha1(self.name.encode("utf-8"))
+        for func in self.code:
+            digest.update(inspect.getsource(func).encode("utf-8"))
+        digest.update(json.dumps(self.params, sort_keys=True, default=str).encode("utf-8"))
+        for path in self.files:
+            digest.update(hash_file(path).encode("utf-8"))
+        for key in upstream_keys:
+            digest.update(key.encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+
+class Pipeline:
+    """Runs stages in order, reusing any stage whose checkpoint key is unchanged"""
+
+    def __init__(self, stages, checkpoint_dir, context=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = [stage.name for stage in stages]
+        self.checkpoint_dir = checkpoint_dir
+        self.context = context
+        self._keys = {}
+        self._outputs = {}
+
+    def checkpoint_path(self, stage, key):
+        extension = FORMATS[stage.fmt][0]
+        return os.path.join(self.checkpoint_dir, stage.name, f"{key}{extension}")
+
+    def stage_key(self, name):
+        if name not in self._keys:
+            stage = self.stages[name]
+            self._keys[name] = stage.key([self.stage_key(upstream) for upstream in stage.inputs])
+        return self._keys[name]
+
+    def output(self, name, force=()):
+        """Output of a stage: from memory, its checkpoint, or by running it"""
+        if name in self._outputs:
+            return self._outputs[name]
+
+        stage = self.stages[name]
+        key = self.stage_key(name)
+        path = self.checkpoint_path(stage, key)
+        save, load = FORMATS[stage.fmt][1:]
+
+        if name not in force and os.path.exists(path):
+            print(f"⚡ {name}: unchanged, loaded checkpoint {key}")
+            value = load(path)
+        else:
+            upstream = [self.output(input_name, force) for input_name in stage.inputs]
+            print(f"▶️ {name}: running...")
+            started = time.time()
+            value = stage.run(self.context, *upstream, **stage.params)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp{FORMATS[stage.fmt][0]}"
+            save(value, tmp_path)
+            os.replace(tmp_path, path)
+            if stage.fmt in FILE_FORMATS:
+                value = load(path)
+            print(f"✅ {name}: done in {time.time() - started:.1f}s, checkpoint {key}")
+
+        self._outputs[name] = value
+        return value
+
+    def run(self, stage=None, from_stage=None, force_all=False):
+        """
+        Run every stage, or re-run just `stage` on its upstream checkpoints.
+        `from_stage` and everything after it re-run even if checkpoints exist.
+        """
+        force = set()
+        if force_all:
+            force = set(self.order)
+        elif from_stage is not None:
+            force = set(self.order[self.order.index(from_stage):])
+        if stage is not None:
+            force.add(stage)
+
+        targets = [stage] if stage is not None else self.order
+        for name in targets:
+            self.output(name, force)
+        return self._outputs
@@ -0,0 +1,171 @@
+"""
+Column-at-a-time text normalization for the pipeline.
+
+clean_text() and safe_join_tags() are the reference per-row implementations.
+clean_texts() produces byte-identical output for a whole column: the texts are
+joined with a record separator and each step runs once over the joined
+string. The separator counts as whitespace, so no \\S+ pattern can match across
+two texts, and it is kept out of whitespace collapsing. Columns are split into
+chunks that are normalized in parallel processes, which a caller cleaning
+many columns can share through normalize_pool().
+
+Usage:
+  python text_normalize.py verify [CSV ...]     # golden check against the per-row functions
+"""
+import argparse
+import ast
+import glob
+import os
+import re
+
+import pandas as pd
+
+from pools import process_pool
+
+SEPARATOR = "\x1e"
+URL_RE = re.compile(r"http\S+|www\S+|https\S+")
+WORD_END_RE = re.compile(r"\S*")
+# Mapping each other character to a space and then collapsing whitespace
+# turns every run of non-[a-z0-9#] characters into one space. This runs on
+# bytes: after encode("ascii", "replace") any non-ASCII character is "?"
+_KEPT = set(b"abcdefghijklmnopqrstuvwxyz0123456789#\x1e")
+NON_TEXT_TABLE = bytes(byte if byte in _KEPT else ord(" ") for byte in range(256))
+# A list of plain quoted strings, the common case literal_eval is not needed for
+_QUOTED = r"""(?:'[^'\\\n]*'|"[^"\\\n]*")"""
+TAG_LIST_RE = re.compile(rf"\[(?:{_QUOTED}(?:, *{_QUOTED})*)?\]")
+TAG_RE = re.compile(r"""'([^']*)'|"([^"]*)\"""")
+
+CHUNK_SIZE = 20000
+WORKERS = int(os.getenv("TEXT_NORMALIZE_WORKERS", str(os.cpu_count() or 1)))
+
+
+def safe_join_tags(x):
+    if isinstance(x, str):
+        try:
+            return " ".join(ast.literal_eval(x))
+        except Exception:
+            return x
+    return ""
+
+
+def clean_text(text: str) -> str:
+    text = text.lower()
+    text = re.sub(r"http\S+|www\S+|https\S+", "", text)
+    text = re.sub(r"\S+@\S+", "", text)
+    text = re.sub(r"[^a-z0-9#\s]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def join_tags(x):
+    """safe_join_tags() with a regex fast path for lists of plain quoted strings"""
+    if isinstance(x, str) and TAG_LIST_RE.fullmatch(x):
+        return " ".join(single or double for single, double in TAG_RE.findall(x))
+    return safe_join_tags(x)
+
+
+def strip_emails(text):
+    """
+    re.sub(r"\S+@\S+", "", text) without a regex scan: that pattern removes each
+    whole whitespace-delimited word with an "@" after its first character and
+    before its last, so only the words around an "@" need to be looked at.
+    """
+    pieces, last = [], 0
+    position = text.find("@")
+    while position != -1:
+        start = position
+        while start > 0 and not text[start - 1].isspace():
+            start -= 1
+        end = WORD_END_RE.match(text, position).end()
+        if "@" in text[start + 1 : end - 1]:
+            pieces.append(text[last:start])
+            last = end
+        position = text.find("@", end)
+    pieces.append(text[last:])
+    return "".join(pieces)
+
+
+def clean_texts_batch(texts):
+    """clean_text() for a list of texts with one pass of each regex"""
+    if not texts:
+        return []
+    if any(SEPARATOR in text for text in texts):
+        return [clean_text(text) for text in texts]
+
+    joined = SEPARATOR.join(texts).lower()
+    joined = URL_RE.sub("", joined)
+    joined = strip_emails(joined)
+    data = joined.encode("ascii", "replace").translate(NON_TEXT_TABLE)
+    data = b" ".join(data.split())
+    data = data.replace(b" \x1e", b"\x1e").replace(b"\x1e ", b"\x1e")
+    return data.decode("ascii").split(SEPARATOR)
+
+
+def normalize_pool(workers=None):
+    """A process pool for clean_texts() calls to share, or None when text is cleaned in-process"""
+    workers = workers or WORKERS
+    if workers <= 1:
+        return None
+    return process_pool(workers)
+
+
+def clean_texts(texts, workers=None, chunk_size=CHUNK_SIZE, pool=None):
+    """
+    clean_text() for a whole column, chunked across worker processes. pool is
+    a normalize_pool() to reuse, so callers cleaning many columns start the
+    workers once; without one a pool is started for this call.
+    """
+    texts = list(texts)
+    chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if len(chunks) <= 1 or (pool is None and (workers or WORKERS) <= 1):
+        return [text for chunk in chunks for text in clean_texts_batch(chunk)]
+    if pool is not None:
+        return [text for cleaned in pool.map(clean_texts_batch, chunks) for text in cleaned]
+    with normalize_pool(min(workers or WORKERS, len(chunks))) as pool:
+        return [text for cleaned in pool.map(clean_texts_batch, chunks) for text in cleaned]
+
+
+def build_text(df: pd.DataFrame) -> pd.Series:
+    return (
+        df["title"].fillna("")
+        + " "
+        + df["description"].fillna("")
+        + " "
+        + df["tags"].map(join_tags)
+    )
+
+
+def verify(df: pd.DataFrame, workers=None):
+    """Rows where the column engine differs from the per-row reference (should be none)"""
+    reference_text = df["title"].fillna("") + " " + df["description"].fillna("") + " " + df["tags"].apply(safe_join_tags)
+    reference = reference_text.apply(clean_text).tolist()
+    text = build_text(df)
+    actual = clean_texts(text, workers=workers)
+    mismatches = [
+        i for i, (a, b, t, r) in enumerate(zip(actual, reference, text, reference_text))
+        if a.encode("utf-8") != b.encode("utf-8") or t != r
+    ]
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the column text normalizer against the per-row functions")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("paths", nargs="*", help="CSV files with title, description and tags columns")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = args.paths or sorted(glob.glob(os.path.join(base_dir, "second_layer_data", "*.csv")))
+    failed = False
+    for path in paths:
+        df = pd.read_csv(path, usecols=["title", "description", "tags"])
+        mismatches = verify(df, workers=args.workers)
+        failed = failed or bool(mismatches)
+        status = "OK" if not mismatches else f"{len(mismatches)} mismatches, first rows {mismatches[:5]}"
+        print(f"{os.path.basename(path)}: {len(df)} rows, {status}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
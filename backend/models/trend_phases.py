@@ -0,0 +1,296 @@
+"""
+Incremental keyword trend phases, the logic of the Cluster_*.ipynb notebooks.
+
+For every keyword the notebooks count mentions and average engagement per
+month, take the slope of the mentions over the last three active months as
+the velocity, and split keywords into Emerging / Growing / Peaking / Decaying
+on velocity > 0 and the median engagement. TrendPhaseState keeps the
+per-(keyword, month) mention counts and engagement sums in a KeywordMonthCube,
+the structure the forecasts count mentions with, so a new batch of videos is
+built into a cube of its own, added, and only the keywords it touches are
+recomputed. The slope has a closed form: with consecutive positions it is
+y[-1] - y[-2] for two months and (y[-1] - y[-3]) / 2 for three.
+
+Usage:
+  python trend_phases.py update BATCH_CSV --state STATE.npz --output PHASES.csv [--dates VIDEOS_CSV]
+  python trend_phases.py verify BATCH_CSV [--dates VIDEOS_CSV]   # compare with the notebook code
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from count_cube import KeywordMonthCube
+
+PHASES = np.array(["Emerging", "Growing", "Peaking", "Decaying"])
+VELOCITY_THRESHOLD = 0
+# Phases are computed per category file, so every keyword shares one cube category
+CATEGORY = ""
+TOTALS = ("mentions", "engagement_sum", "engagement_count")
+# Joins videoId and keyword into one seen-row key; the layer data has a row per (video, keyword)
+KEY_SEPARATOR = "\x1f"
+
+
+def prepare_batch(df):
+    """Rows the notebook keeps, as (category, keyword, publishedAt, videoId, engagement_rate)"""
+    df = df.dropna(subset=["keywords"])
+    dates = pd.to_datetime(df["publishedAt"], errors="coerce", utc=True)
+    valid = dates.notna().to_numpy()
+    return pd.DataFrame({
+        "category": CATEGORY,
+        "keyword": df["keywords"].astype(str).str.strip().str.lower().to_numpy()[valid],
+        "publishedAt": dates.to_numpy()[valid],
+        "videoId": df["videoId"].to_numpy()[valid],
+        "engagement_rate": df["engagement_rate"].to_numpy(dtype=np.float64)[valid],
+    })
+
+
+def batch_cube(batch):
+    """A prepared batch as a KeywordMonthCube with the phase totals"""
+    return KeywordMonthCube.build(batch, keyword_col="keyword", totals={
+        # Mentions count videoIds, like the notebook's agg({"videoId": "count"})
+        "mentions": batch["videoId"].notna().to_numpy(),
+        "engagement_sum": batch["engagement_rate"].fillna(0.0).to_numpy(),
+        "engagement_count": batch["engagement_rate"].notna().to_numpy(),
+    })
+
+
+def classify_phases(velocity, engagement, engagement_threshold, velocity_threshold=VELOCITY_THRESHOLD):
+    """The notebook's classify_phase() for arrays; a NaN engagement is Decaying, as there"""
+    rising = velocity > velocity_threshold
+    engaged = engagement >= engagement_threshold
+    return np.select(
+        [rising & (engagement < engagement_threshold), rising & engaged, ~rising & engaged],
+        PHASES[:3],
+        default=PHASES[3],
+    )
+
+
+class TrendPhaseState:
+    """
+    Running per-(keyword, month) mention counts and engagement sums, held as
+    a KeywordMonthCube with one row per keyword. A keyword's months are its
+    row's cells, in month order.
+    """
+
+    def __init__(self, cube=None, seen_rows=None):
+        if cube is None:
+            empty = sparse.csr_matrix((0, 0), dtype=np.int64)
+            cube = KeywordMonthCube([], [], 0, empty, {name: empty for name in TOTALS})
+        self.cube = cube
+        self.seen_rows = np.zeros(0, dtype=str) if seen_rows is None else np.asarray(seen_rows, dtype=str)
+        self.velocity = np.zeros(len(cube))
+        self.engagement = np.full(len(cube), np.nan)
+        self._refresh(np.arange(len(cube)))
+
+    def __len__(self):
+        return len(self.cube)
+
+    @property
+    def keywords(self):
+        return self.cube.keywords
+
+    def update(self, df):
+        """
+        Add a batch of videos (keywords, publishedAt, videoId, engagement_rate)
+        and recompute the keywords it mentions. (videoId, keyword) rows already
+        added by an earlier batch are skipped, so a video's keyword rows may
+        arrive in different batches; duplicates within a batch count, as in
+        the notebook.
+        """
+        batch = prepare_batch(df)
+        known = batch["videoId"].notna().to_numpy()
+        row_keys = (batch["videoId"].astype(str) + KEY_SEPARATOR + batch["keyword"]).to_numpy(dtype=str)
+        if len(self.seen_rows):
+            position = np.minimum(np.searchsorted(self.seen_rows, row_keys), len(self.seen_rows) - 1)
+            new = ~known | (self.seen_rows[position] != row_keys)
+            batch, row_keys, known = batch[new], row_keys[new], known[new]
+        if len(batch) == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Merge the (already unseen) keys into the sorted list without re-sorting it
+        new_keys = np.unique(row_keys[known])
+        seen = self.seen_rows.astype(np.result_type(self.seen_rows, new_keys), copy=False)
+        self.seen_rows = np.insert(seen, np.searchsorted(seen, new_keys), new_keys)
+
+        added = batch_cube(batch)
+        self.cube = self.cube.add(added)
+        grown = len(self.cube) - len(self.velocity)
+        self.velocity = np.concatenate([self.velocity, np.zeros(grown)])
+        self.engagement = np.concatenate([self.engagement, np.full(grown, np.nan)])
+        touched = np.unique([self.cube.row(CATEGORY, keyword) for keyword in added.keywords]).astype(np.int64)
+        self._refresh(touched)
+        return touched
+
+    def _refresh(self, codes):
+        """Recompute velocity and mean engagement of the given keyword rows from their cells"""
+        if len(codes) == 0:
+            return
+        indptr = self.cube.counts.indptr
+        starts, ends = indptr[codes], indptr[codes + 1]
+        lengths = ends - starts
+
+        # Slope of the mentions over the keyword's last (up to) three active months
+        mentions = self.cube.totals["mentions"].data
+        y_last = mentions[np.maximum(ends - 1, 0)] if len(mentions) else np.zeros(len(codes))
+        y_second = mentions[np.maximum(ends - 2, 0)] if len(mentions) else np.zeros(len(codes))
+        y_third = mentions[np.maximum(ends - 3, 0)] if len(mentions) else np.zeros(len(codes))
+        self.velocity[codes] = np.select(
+            [lengths >= 3, lengths == 2], [(y_last - y_third) / 2, y_last - y_second], default=0.0
+        )
+
+        # Mean over the keyword's months of each month's mean engagement
+        offsets = np.cumsum(lengths) - lengths
+        cells = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        engagement_sum = self.cube.totals["engagement_sum"].data[cells]
+        engagement_count = self.cube.totals["engagement_count"].data[cells]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            monthly = engagement_sum / engagement_count
+        valid = engagement_count > 0
+        nonempty = lengths > 0
+        totals = np.zeros(len(codes))
+        counts = np.zeros(len(codes))
+        if nonempty.any():
+            totals[nonempty] = np.add.reduceat(np.where(valid, monthly, 0.0), offsets[nonempty])
+            counts[nonempty] = np.add.reduceat(valid.astype(np.float64), offsets[nonempty])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.engagement[codes] = np.where(counts > 0, totals / counts, np.nan)
+
+    def phases(self):
+        """The trend phase CSV table: keyword, velocity, engagement_rate, phase, sorted by keyword"""
+        engagement_threshold = np.nanmedian(self.engagement) if np.isfinite(self.engagement).any() else np.nan
+        table = pd.DataFrame({
+            "keyword": self.keywords,
+            "velocity": self.velocity,
+            "engagement_rate": self.engagement,
+            "phase": classify_phases(self.velocity, self.engagement, engagement_threshold),
+        })
+        return table.sort_values("keyword", kind="stable").reset_index(drop=True)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **self.cube.arrays(), seen_rows=self.seen_rows)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(KeywordMonthCube.from_arrays(data), data["seen_rows"])
+
+
+def reference_phases(df):
+    """Steps 1-6 of the notebooks' keyword trend detection, kept as the reference path"""
+    df = df.copy()
+    df["publishedAt"] = pd.to_datetime(df["publishedAt"], errors="coerce", utc=True)
+    df = df.dropna(subset=["keywords"]).sort_values("publishedAt")
+    df["keyword"] = df["keywords"].str.strip().str.lower()
+    df["month"] = df["publishedAt"].dt.tz_localize(None).dt.to_period("M")
+
+    keyword_time = (
+        df.groupby(["keyword", "month"])
+          .agg({"videoId": "count", "engagement_rate": "mean"})
+          .reset_index()
+          .rename(columns={"videoId": "mentions"})
+    )
+
+    def recent_velocity(x):
+        if len(x) < 2:
+            return 0
+        t = np.arange(len(x))[-3:]
+        y = x["mentions"].values[-3:]
+        return np.polyfit(t, y, 1)[0]
+
+    velocities = keyword_time.groupby("keyword")[["mentions"]].apply(recent_velocity).reset_index(name="velocity")
+    eng = keyword_time.groupby("keyword")["engagement_rate"].mean().reset_index()
+    score_df = velocities.merge(eng, on="keyword", how="left")
+    eng_thresh = score_df["engagement_rate"].median()
+
+    def classify_phase(velocity, engagement, v_thresh=0, e_thresh=eng_thresh):
+        if velocity > v_thresh and engagement < e_thresh:
+            return "Emerging"
+        elif velocity > v_thresh and engagement >= e_thresh:
+            return "Growing"
+        elif velocity <= v_thresh and engagement >= e_thresh:
+            return "Peaking"
+        else:
+            return "Decaying"
+
+    score_df["phase"] = score_df.apply(lambda r: classify_phase(r["velocity"], r["engagement_rate"]), axis=1)
+    return score_df
+
+
+def compare(expected, actual, tolerance=1e-9):
+    """
+    Keywords whose phase or (within tolerance) velocity and engagement differ.
+    np.polyfit returns slopes like 1e-16 for flat mentions, which the notebook
+    then classifies as rising; the closed form gives exactly 0, so phases are
+    only compared where the reference velocity is not within tolerance of 0.
+    """
+    merged = expected.merge(actual, on="keyword", how="outer", suffixes=("_expected", "_actual"), indicator=True)
+    close = lambda name: np.isclose(
+        merged[f"{name}_expected"].to_numpy(dtype=np.float64),
+        merged[f"{name}_actual"].to_numpy(dtype=np.float64),
+        rtol=tolerance, atol=tolerance, equal_nan=True,
+    )
+    flat = np.abs(merged["velocity_expected"].to_numpy(dtype=np.float64)) <= tolerance
+    same = (
+        (merged["_merge"] == "both").to_numpy()
+        & close("velocity")
+        & close("engagement_rate")
+        & ((merged["phase_expected"] == merged["phase_actual"]).to_numpy() | flat)
+    )
+    return merged.loc[~same, "keyword"].tolist()
+
+
+def read_batch(path, dates_path=None):
+    """A batch CSV, with publishedAt merged in by videoId from dates_path when given (notebook cell 23)"""
+    df = pd.read_csv(path)
+    if dates_path is not None:
+        dates = pd.read_csv(dates_path, usecols=["videoId", "publishedAt"])
+        df = df.drop(columns=["publishedAt"], errors="ignore").merge(dates, on="videoId", how="left")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update keyword trend phases")
+    parser.add_argument("command", choices=["update", "verify"])
+    parser.add_argument("batch", help="CSV of new videos: videoId, keywords, engagement_rate, publishedAt")
+    parser.add_argument("--dates", help="CSV with videoId and publishedAt to merge into the batch")
+    parser.add_argument("--state", help="running state (.npz), created when missing")
+    parser.add_argument("--output", help="trend phases CSV to write")
+    args = parser.parse_args()
+
+    df = read_batch(args.batch, args.dates)
+    if args.command == "verify":
+        expected = reference_phases(df)
+        # One batch; the rows split across two batches, so a video's keyword rows
+        # arrive in both; and the first batch sent again, which must change nothing
+        cases = {"single batch": [df], "row-split batches": [df.iloc[::2], df.iloc[1::2], df.iloc[::2]]}
+        failed = False
+        for name, batches in cases.items():
+            state = TrendPhaseState()
+            for batch in batches:
+                state.update(batch)
+            mismatches = compare(expected, state.phases())
+            failed = failed or bool(mismatches)
+            status = "OK" if not mismatches else f"{len(mismatches)} mismatches: {mismatches[:5]}"
+            print(f"{name}: {len(state)} keywords, {status}")
+        raise SystemExit(1 if failed else 0)
+
+    if not args.state or not args.output:
+        parser.error("update needs --state and --output")
+    state = TrendPhaseState.load(args.state) if os.path.exists(args.state) else TrendPhaseState()
+    touched = state.update(df)
+    state.save(args.state)
+
+    phases = state.phases()
+    tmp_path = f"{args.output}.tmp"
+    phases.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, args.output)
+    print(f"✅ {len(touched)} of {len(state)} keywords updated, saved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
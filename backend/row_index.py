@@ -0,0 +1,142 @@
+import base64
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar import load_rows, read_table, take_records
+
+# Columns a page can be filtered or sorted on; only these are held in memory
+INDEX_COLUMNS = ['keywords', 'category_confidence', 'viewCount', 'engagement_rate']
+SORT_COLUMNS = ['viewCount', 'engagement_rate']
+SAMPLE_ROWS = 10
+
+PAGE_SIZE = int(os.getenv('CSV_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('CSV_MAX_PAGE_SIZE', '500'))
+
+
+def encode_cursor(sort, descending, key, row):
+    payload = json.dumps({'sort': sort, 'desc': descending, 'key': key, 'row': row})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return payload['sort'], bool(payload['desc']), float(payload['key']), int(payload['row'])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class CategoryRowIndex:
+    """
+    The filter and sort columns of one second-layer table, held as arrays with
+    a precomputed order per sort column. A page is found from the arrays alone
+    and only its own rows are read from disk, so memory does not grow with the
+    width of the table and a page costs the same wherever it is.
+
+    Pages use keyset cursors: each cursor holds the sort key and row position
+    of the last row served, and the next page starts right after it.
+    """
+
+    def __init__(self, directory, name, manifest=None):
+        self.directory = directory
+        self.name = name
+        self.manifest = manifest
+        # Memory-mapped, so only the pages of the rows served are read in. A
+        # stale copy is rebuilt here, never re-parsed from the CSV per page
+        self.table = load_rows(directory, name, manifest)
+
+        sample = read_table(directory, name, limit=SAMPLE_ROWS, manifest=manifest)
+        self.columns = list(sample.columns)
+        self.sample_data = sample.to_dict('records')
+
+        df = read_table(directory, name, columns=INDEX_COLUMNS, manifest=manifest)
+        codes, keywords = pd.factorize(df['keywords'].astype(str).str.strip().str.lower())
+        self.keyword_codes = codes.astype(np.int32)
+        self.keyword_lookup = {keyword: code for code, keyword in enumerate(keywords)}
+        self.confidence = df['category_confidence'].to_numpy(dtype=np.float64)
+        self.engagement_rate = df['engagement_rate'].to_numpy(dtype=np.float64)
+
+        self.sort_keys = {}
+        self.orders = {}
+        for column in SORT_COLUMNS:
+            # NaN sorts last in both directions
+            values = df[column].to_numpy(dtype=np.float64)
+            for descending in (False, True):
+                keys = np.where(np.isnan(values), np.inf, -values if descending else values)
+                order = np.lexsort((np.arange(len(keys)), keys))
+                self.sort_keys[column, descending] = keys[order]
+                self.orders[column, descending] = order
+
+    def __len__(self):
+        return len(self.keyword_codes)
+
+    def summary(self):
+        return {
+            'total_rows': len(self),
+            'columns': self.columns,
+            'sample_data': self.sample_data
+        }
+
+    def match(self, keywords=None, min_confidence=None, min_engagement=None, max_engagement=None):
+        """Boolean mask of the rows passing every given filter"""
+        mask = np.ones(len(self), dtype=bool)
+        if keywords:
+            codes = [self.keyword_lookup[keyword] for keyword in keywords if keyword in self.keyword_lookup]
+            mask &= np.isin(self.keyword_codes, codes)
+        if min_confidence is not None:
+            mask &= self.confidence >= min_confidence
+        if min_engagement is not None:
+            mask &= self.engagement_rate >= min_engagement
+        if max_engagement is not None:
+            mask &= self.engagement_rate <= max_engagement
+        return mask
+
+    def page(self, mask, sort=None, descending=True, cursor=None, limit=PAGE_SIZE):
+        """Row positions of the next page of matching rows, and the cursor of the page after it"""
+        if sort is None:
+            keys = order = None
+        elif sort in SORT_COLUMNS:
+            keys, order = self.sort_keys[sort, descending], self.orders[sort, descending]
+        else:
+            raise ValueError(f"Sort must be one of {', '.join(SORT_COLUMNS)}")
+
+        start = 0
+        if cursor is not None:
+            cursor_sort, cursor_descending, cursor_key, cursor_row = decode_cursor(cursor)
+            if cursor_sort != sort or (sort is not None and cursor_descending != descending):
+                raise ValueError("Cursor belongs to a different sort order")
+            if order is None:
+                start = cursor_row + 1
+            else:
+                # First row after (key, row) in the (key, row) ordering
+                low = np.searchsorted(keys, cursor_key, side='left')
+                high = np.searchsorted(keys, cursor_key, side='right')
+                start = low + np.searchsorted(order[low:high], cursor_row, side='right')
+
+        candidates = np.arange(start, len(self)) if order is None else order[start:]
+        # Scan in growing blocks, so a page only reads as far into the order as it needs
+        found, found_count = [], 0
+        block = max(limit + 1, 1024)
+        offset = 0
+        while offset < len(candidates) and found_count <= limit:
+            positions = offset + np.flatnonzero(mask[candidates[offset:offset + block]])
+            found.append(positions)
+            found_count += len(positions)
+            offset += block
+            block *= 2
+        positions = np.concatenate(found)[:limit + 1] if found else np.zeros(0, dtype=np.int64)
+
+        rows = candidates[positions[:limit]]
+        next_cursor = None
+        if len(positions) > limit and limit > 0:
+            last = positions[limit - 1]
+            key = float(candidates[last]) if order is None else float(keys[start + last])
+            next_cursor = encode_cursor(sort, descending, key, int(candidates[last]))
+        return rows, next_cursor
+
+    def fetch(self, rows):
+        """Full records of the given row positions, in order"""
+        return take_records(self.directory, self.name, rows, manifest=self.manifest, table=self.table)
@@ -0,0 +1,138 @@
+import hashlib
+import os
+import threading
+import time
+
+from columnar import MANIFEST_FILE
+
+WATCHED_EXTENSIONS = ('.csv', '.json')
+# Derived from the watched CSVs and rewritten by the API itself when a columnar
+# copy is refreshed during a build, so it must not count as a data change
+IGNORED_FILES = (MANIFEST_FILE,)
+
+
+def fingerprint_paths(paths, extensions=WATCHED_EXTENSIONS, ignored=IGNORED_FILES):
+    """Hash the name, size and modification time of every data file under the watched paths"""
+    entries = []
+    for root in paths:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith(extensions) or filename in ignored:
+                    continue
+                file_path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1('\n'.join(entries).encode('utf-8')).hexdigest()[:12]
+
+
+class DataSnapshot:
+    """Everything the API serves for one version of the data files, never mutated once built"""
+
+    def __init__(self, version, **data):
+        self.version = version
+        self.loaded_at = time.time()
+        self.__dict__.update(data)
+
+
+class SnapshotManager:
+    """
+    Holds the current data snapshot and swaps in a rebuilt one when the data files change.
+
+    A forced reload only rebuilds the snapshot of the process that handled it,
+    so request_reload() also touches reload_marker; every process sharing the
+    marker notices the new mtime on its next request (check_reload_marker())
+    and reloads in the background, whatever the polling interval.
+    """
+
+    def __init__(self, build, paths, extensions=WATCHED_EXTENSIONS, interval=30, reload_marker=None):
+        self.build = build
+        self.paths = paths
+        self.extensions = extensions
+        self.interval = interval
+        self.reload_marker = reload_marker
+        self._lock = threading.Lock()
+        self._marker_lock = threading.Lock()
+        self._thread = None
+        self._marker_seen = self._marker_mtime()
+        self.current = build(self.fingerprint(), initial=True)
+
+    def fingerprint(self):
+        return fingerprint_paths(self.paths, self.extensions)
+
+    def reload(self, force=False):
+        """Rebuild the snapshot and swap it in; returns False when nothing changed"""
+        with self._lock:
+            version = self.fingerprint()
+            if not force and version == self.current.version:
+                return False
+
+            started = time.time()
+            snapshot = self.build(version, initial=False)
+            # Requests hold a reference to the snapshot they started with, so a
+            # single assignment is enough to switch new requests to the new data
+            self.current = snapshot
+            print(f"Data snapshot {version} loaded in {time.time() - started:.1f}s")
+            return True
+
+    def _marker_mtime(self):
+        if not self.reload_marker:
+            return None
+        try:
+            return os.stat(self.reload_marker).st_mtime_ns
+        except OSError:
+            return None
+
+    def request_reload(self):
+        """Reload this process now, then touch the marker so every other process follows"""
+        self.reload(force=True)
+        if self.reload_marker:
+            with self._marker_lock:
+                with open(self.reload_marker, 'w') as f:
+                    f.write(f"{self.current.version} {time.time_ns()}\n")
+                self._marker_seen = self._marker_mtime()
+
+    def check_reload_marker(self):
+        """Start a background reload when another process has touched the marker since we last looked"""
+        mtime = self._marker_mtime()
+        if mtime == self._marker_seen:
+            return False
+        with self._marker_lock:
+            if mtime == self._marker_seen:
+                return False
+            self._marker_seen = mtime
+        threading.Thread(target=self._reload_requested, name='data-snapshot-reload', daemon=True).start()
+        return True
+
+    def _reload_requested(self):
+        try:
+            self.reload(force=True)
+        except Exception as e:
+            print(f"Error reloading data snapshot: {e}")
+
+    def start(self):
+        """Poll the data files in a daemon thread and reload when they change"""
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._watch, name='data-snapshot-watcher', daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        pending = None
+        while True:
+            time.sleep(self.interval)
+            try:
+                version = self.fingerprint()
+                if version == self.current.version:
+                    pending = None
+                elif version != pending:
+                    # Wait one more interval so files still being written can settle
+                    pending = version
+                else:
+                    self.reload()
+                    pending = None
+            except Exception as e:
+                print(f"Error reloading data snapshot: {e}")
@@ -14,6 +14,7 @@ export default function KeywordCheckerPage() {
   const [keyword, setKeyword] = useState("")
   const [result, setResult] = useState<KeywordCheckerResponse | null>(null)
   const [loading, setLoading] = useState(false)
+  const [analysisLoading, setAnalysisLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
 
   const handleSubmit = async (e: React.FormEvent) => {
@@ -21,16 +22,22 @@ export default function KeywordCheckerPage() {
     if (!keyword.trim()) return
 
     setLoading(true)
+    setAnalysisLoading(true)
     setError(null)
     setResult(null)
 
     try {
-      const response = await apiService.checkKeyword(keyword.trim())
+      // Show the match and phase data as soon as it arrives, the AI analysis follows
+      const response = await apiService.checkKeywordStream(keyword.trim(), (match) => {
+        setResult({ ...match, future_trend: "", insights: [], recommendations: [] })
+        setLoading(false)
+      })
       setResult(response)
     } catch (err) {
       setError(err instanceof Error ? err.message : "An error occurred while checking the keyword")
     } finally {
       setLoading(false)
+      setAnalysisLoading(false)
     }
   }
 
@@ -278,7 +285,7 @@ export default function KeywordCheckerPage() {
                     </div>
                     <div className="p-4 bg-background/50 rounded-lg border">
                       <p className="text-sm text-foreground leading-relaxed">
-                        {result.future_trend}
+                        {analysisLoading ? "Generating AI analysis..." : result.future_trend}
                       </p>
                     </div>
                   </div>
@@ -89,8 +89,17 @@ export interface KeywordCheckerResponse {
   future_trend: string;
   insights: string[];
   recommendations: string[];
+  top_matches?: Array<{
+    keyword: string;
+    category: string;
+    score: number;
+  }>;
 }
 
+export type KeywordMatch = Omit<KeywordCheckerResponse, 'future_trend' | 'insights' | 'recommendations'>;
+
+export type KeywordAnalysis = Pick<KeywordCheckerResponse, 'future_trend' | 'insights' | 'recommendations'>;
+
 class ApiService {
   private async fetchData<T>(endpoint: string): Promise<T> {
     try {
@@ -162,6 +171,61 @@ class ApiService {
       throw error;
     }
   }
+  async checkKeywordStream(
+    keyword: string,
+    onMatch: (match: KeywordMatch) => void,
+  ): Promise<KeywordCheckerResponse> {
+    try {
+      const response = await fetch(`${API_BASE_URL}/keyword-checker/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ keyword }),
+      });
+
+      if (!response.ok || !response.body) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
+      }
+
+      // The body is NDJSON: a "match" event first, then "analysis" (or "error")
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let match: KeywordMatch | null = null;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value, { stream: !done });
+
+        const lines = buffer.split('\n');
+        buffer = lines.pop() ?? '';
+
+        for (const line of lines) {
+          if (!line.trim()) continue;
+          const message = JSON.parse(line);
+
+          if (message.event === 'match') {
+            match = message.data as KeywordMatch;
+            onMatch(match);
+          } else if (message.event === 'analysis' && match) {
+            return { ...match, ...(message.data as KeywordAnalysis) };
+          } else if (message.event === 'error') {
+            throw new Error(message.error);
+          }
+        }
+
+        if (done) break;
+      }
+
+      throw new Error('Keyword analysis stream ended unexpectedly');
+    } catch (error) {
+      console.error('Error checking keyword:', error);
+      throw error;
+    }
+  }
+
 }
 
 export const apiService = new ApiService();